@@ -1,7 +1,22 @@
 import google.generativeai as genai
+import datetime
+import json
 import os
+import threading
+import time
 from dotenv import load_dotenv
 import streamlit as st
+from llm_cache import make_cache_key, get_cached_response, put_cached_response
+from compaction import estimate_tokens
+from rate_limit import RateLimitedClient, is_retryable
+
+MODEL_NAME = "gemini-2.5-flash"
+# Incrementar cuando cambie el prompt para no reutilizar respuestas en caché obsoletas
+PROMPT_VERSION = 3
+# Guardar la oferta y las instrucciones como contexto en caché de Gemini (se cobra por hora,
+# y Gemini exige un mínimo de tokens para cachear: conviene con ofertas largas y lotes grandes)
+CONTEXT_CACHE = os.getenv("GEMINI_CONTEXT_CACHE", "0") == "1"
+CONTEXT_CACHE_TTL_MINUTES = int(os.getenv("GEMINI_CONTEXT_CACHE_TTL_MINUTES", "30"))
 
 # Cargar variables de entorno
 load_dotenv()
@@ -9,57 +24,55 @@ load_dotenv()
 def get_api_key():
     """Obtiene la API key desde variables de entorno o secrets de Streamlit"""
     # Primero intenta obtener desde secrets de Streamlit (producción)
-    if hasattr(st, 'secrets') and 'GEMINI_API_KEY' in st.secrets:
-        return st.secrets['GEMINI_API_KEY']
+    try:
+        if hasattr(st, 'secrets') and 'GEMINI_API_KEY' in st.secrets:
+            return st.secrets['GEMINI_API_KEY']
+    except FileNotFoundError:
+        pass # Sin secrets.toml (p. ej. ejecución por línea de comandos)
     
     # Si no, usa variables de entorno (desarrollo)
     return os.getenv("GEMINI_API_KEY")
 
+_configured = False
+_configure_lock = threading.Lock()
+
 def configure_gemini():
-    """Configura Gemini con la API key apropiada"""
-    api_key = get_api_key()
-    
-    if not api_key:
-        st.error("""
-        ❌ **Error de Configuración**
-        
-        La variable `GEMINI_API_KEY` no está configurada.
+    """Configura Gemini con la API key apropiada (solo la primera vez)"""
+    global _configured
+    with _configure_lock:
+        if _configured:
+            return True
         
-        **Para desarrollo local:**
-        - Crea un archivo `.env` con: `GEMINI_API_KEY=tu_api_key`
+        api_key = get_api_key()
+        if not api_key:
+            raise RuntimeError("La variable GEMINI_API_KEY no está configurada")
         
-        **Para deploy en Streamlit Cloud:**
-        - Ve a la configuración de tu app en Streamlit Cloud
-        - En la sección "Secrets", agrega: `GEMINI_API_KEY = "tu_api_key"`
-        """)
-        st.stop()
-    
-    try:
         genai.configure(api_key=api_key)
+        _configured = True
         return True
-    except Exception as e:
-        st.error(f"❌ Error configurando Gemini: {e}")
-        st.stop()
 
-# Configurar Gemini al importar el módulo
-configure_gemini()
+def analysis_stamp(job_description):
+    """Identifica la oferta, el modelo y el prompt con que se hizo un análisis"""
+    return make_cache_key("", job_description, MODEL_NAME, PROMPT_VERSION)[:16]
 
-def analyze_cv(cv_text, job_description):
-    """Analiza un CV usando la API de Gemini"""
-    try:
-        model = genai.GenerativeModel("gemini-2.5-flash")
-        prompt = f"""
-        Eres un analista de recursos humanos experto. Analiza el CV del candidato en función de la oferta de trabajo provista.
+def load_analysis_json(analysis_result):
+    """Convierte la respuesta del modelo en un dict, quitando el bloque ```json si existe"""
+    result_text = analysis_result.strip()
+    if result_text.startswith("```json"):
+        result_text = result_text[7:]
+    if result_text.endswith("```"):
+        result_text = result_text[:-3]
+    return json.loads(result_text)
 
-        Job Description:
-        {job_description}
 
-        CV:
-        {cv_text}
+def _instructions(job_description):
+    """Prefijo común a todos los CVs de una oferta: rol, instrucciones, formato y oferta"""
+    return f"""
+        Eres un analista de recursos humanos experto. Analiza el CV del candidato en función de la oferta de trabajo provista.
 
          Instrucciones para el análisis:
         1.  **Idioma:** Realiza todo el análisis en español.
-        2.  **Análisis de coincidencias:** Identifica y lista las habilidades y la experiencia clave del CV que coinciden directamente con los requisitos de la oferta para un "Junior Project Manager".
+        2.  **Análisis de coincidencias:** Identifica y lista las habilidades y la experiencia clave del CV que coinciden directamente con los requisitos de la oferta para el puesto descrito.
         3.  **Áreas de mejora:** Señala las áreas en las que la experiencia del candidato parece ser deficiente o no coincide con los requisitos de la oferta.
         4.  **Resumen de idoneidad:** Ofrece un resumen conciso de la idoneidad del candidato para el rol, basándote en tu análisis.
         5.  **Score de fit:** Asigna un puntaje de 0.0 a 10.0 que indique qué tan bien se ajusta el candidato al puesto, donde:
@@ -75,7 +88,7 @@ def analyze_cv(cv_text, job_description):
         {{
             "nombre_candidato": "Nombre completo del candidato (si está disponible en el CV)",
             "email": "Email del candidato (si está disponible)",
-            "puesto_solicitado": "Junior Project Manager",
+            "puesto_solicitado": "Título del puesto según la oferta",
             "score_fit": 7.5,
             "nivel_experiencia": "Junior",
             "tiempo_experiencia": "2 años",
@@ -92,9 +105,172 @@ def analyze_cv(cv_text, job_description):
             "riesgos": ["riesgo 1", "riesgo 2"],
             "fortalezas": ["fortaleza 1", "fortaleza 2"]
         }}
+        ```
+
+        Job Description:
+        {job_description}
         """
-        response = model.generate_content(prompt)
-        return response.text
-    except Exception as e:
-        st.error(f"❌ Error analizando CV: {e}")
-        return None
+
+_models = {}
+_models_lock = threading.Lock()
+_usage = {"requests": 0, "prompt_tokens": 0, "cached_tokens": 0, "output_tokens": 0}
+_usage_lock = threading.Lock()
+
+def _create_model(job_description):
+    """Modelo con la oferta y las instrucciones como system_instruction, en caché de Gemini si está activado.
+
+    Devuelve (modelo, instante en que hay que recrearlo o None).
+    """
+    instructions = _instructions(job_description)
+    if CONTEXT_CACHE:
+        try:
+            ttl = datetime.timedelta(minutes=CONTEXT_CACHE_TTL_MINUTES)
+            cached_content = genai.caching.CachedContent.create(
+                model=f"models/{MODEL_NAME}", system_instruction=instructions, ttl=ttl)
+            # Recrear un poco antes de que expire para no enviar peticiones con un caché vencido
+            expires_at = time.monotonic() + ttl.total_seconds() * 0.9
+            return genai.GenerativeModel.from_cached_content(cached_content=cached_content), expires_at
+        except Exception:
+            pass # Oferta por debajo del mínimo cacheable o caché no disponible: prefijo normal
+    return genai.GenerativeModel(MODEL_NAME, system_instruction=instructions), None
+
+def _get_model(job_description):
+    """Modelo reutilizable para todas las peticiones de una misma oferta"""
+    configure_gemini()
+    stamp = analysis_stamp(job_description)
+    with _models_lock:
+        model, expires_at = _models.get(stamp, (None, None))
+        if model is None or (expires_at is not None and time.monotonic() >= expires_at):
+            model, expires_at = _create_model(job_description)
+            _models[stamp] = (model, expires_at)
+        return model
+
+# Compartido por todos los hilos y sesiones del proceso, para respetar la cuota del proyecto
+_client = RateLimitedClient()
+
+def _generate(job_description, contents):
+    """Envía una petición a Gemini dentro de la cuota, reintentando errores transitorios, y acumula los tokens consumidos"""
+    model = _get_model(job_description)
+
+    def request():
+        response = model.generate_content(contents)
+        usage = getattr(response, "usage_metadata", None)
+        with _usage_lock:
+            _usage["requests"] += 1
+            if usage:
+                _usage["prompt_tokens"] += usage.prompt_token_count or 0
+                _usage["cached_tokens"] += getattr(usage, "cached_content_token_count", 0) or 0
+                _usage["output_tokens"] += usage.candidates_token_count or 0
+        return response.text, usage.prompt_token_count if usage else None
+
+    return _client.call(request, estimate_tokens(_instructions(job_description)) + estimate_tokens(contents))
+
+def get_usage_stats():
+    """Peticiones y tokens enviados a Gemini desde que arrancó el proceso, más reintentos y concurrencia actual"""
+    with _usage_lock:
+        usage = dict(_usage)
+    usage.update(_client.get_stats())
+    return usage
+
+def _is_valid_analysis(response_text):
+    """Si la respuesta es JSON completo; las cortadas o mal formadas no se guardan en caché"""
+    try:
+        load_analysis_json(response_text or "")
+        return True
+    except json.JSONDecodeError:
+        return False
+
+def _get_cached_analysis(cache_key):
+    """Respuesta en caché, ignorando las inválidas guardadas por versiones anteriores"""
+    cached_response = get_cached_response(cache_key)
+    return cached_response if _is_valid_analysis(cached_response) else None
+
+def analyze_cv(cv_text, job_description):
+    """Analiza un CV usando la API de Gemini.
+
+    Los errores transitorios (429, 5xx, red) se reintentan; si persisten, o el
+    error no es transitorio, se propaga para que quien llama lo informe.
+    """
+    cache_key = make_cache_key(cv_text, job_description, MODEL_NAME, PROMPT_VERSION)
+    cached_response = _get_cached_analysis(cache_key)
+    if cached_response is not None:
+        return cached_response
+
+    response_text = _generate(job_description, f"CV:\n{cv_text}")
+    # Una respuesta inválida se devuelve para informar el error, pero no se cachea para que se reintente
+    if _is_valid_analysis(response_text):
+        put_cached_response(cache_key, response_text)
+    return response_text
+
+def _analyze_batch(cv_texts, job_description):
+    """Analiza varios CVs en una sola petición; devuelve {cv_id: análisis} con los que vinieron bien"""
+    ids = {f"cv{i}": cv_id for i, cv_id in enumerate(cv_texts, 1)}
+    cvs = "\n\n".join(f"=== CV id: {short_id} ===\n{cv_texts[cv_id]}" for short_id, cv_id in ids.items())
+    contents = f"""
+        Analiza por separado cada uno de los siguientes {len(ids)} CVs contra la oferta.
+        Retorna exclusivamente un array JSON con un objeto por CV, con el formato JSON requerido
+        más el campo "cv_id" con el identificador del CV (por ejemplo "cv1").
+
+        {cvs}
+        """
+    response_text = _generate(job_description, contents)
+    try:
+        items = load_analysis_json(response_text or "")
+    except json.JSONDecodeError:
+        return {} # Respuesta cortada o inválida: se reintenta dividiendo el lote
+    results = {}
+    for item in items if isinstance(items, list) else []:
+        if isinstance(item, dict) and item.get("cv_id") in ids:
+            cv_id = ids[item.pop("cv_id")]
+            results[cv_id] = json.dumps(item, ensure_ascii=False)
+    return results
+
+def analyze_cvs(cv_texts, job_description):
+    """Analiza varios CVs ({cv_id: texto}) contra una oferta con el mínimo de peticiones.
+
+    La oferta y las instrucciones se envían una vez por lote. Los CVs que falten en
+    una respuesta parcial se reintentan en un lote nuevo, y si no vuelve ninguno el
+    lote se divide en dos. Devuelve {cv_id: respuesta JSON}; los CVs que fallan
+    incluso solos quedan con la excepción en lugar de la respuesta.
+    """
+    results = {}
+    pending = {}
+    for cv_id, cv_text in cv_texts.items():
+        cached_response = _get_cached_analysis(make_cache_key(cv_text, job_description, MODEL_NAME, PROMPT_VERSION))
+        if cached_response is not None:
+            results[cv_id] = cached_response
+        else:
+            pending[cv_id] = cv_text
+
+    def analyze(batch):
+        if len(batch) == 1:
+            (cv_id, cv_text), = batch.items()
+            try:
+                results[cv_id] = analyze_cv(cv_text, job_description)
+            except Exception as e:
+                results[cv_id] = e
+            return
+        try:
+            answered = _analyze_batch(batch, job_description)
+        except Exception as e:
+            if is_retryable(e):
+                # Ya se reintentó: partir el lote no ayuda con la cuota agotada o el servicio caído
+                results.update((cv_id, e) for cv_id in batch)
+                return
+            answered = {} # P. ej. un lote demasiado grande para el modelo: se divide
+        for cv_id, response_text in answered.items():
+            put_cached_response(make_cache_key(batch[cv_id], job_description, MODEL_NAME, PROMPT_VERSION),
+                                response_text)
+            results[cv_id] = response_text
+        missing = {cv_id: cv_text for cv_id, cv_text in batch.items() if cv_id not in answered}
+        if missing and answered:
+            analyze(missing)
+        elif missing:
+            items = list(missing.items())
+            analyze(dict(items[:len(items) // 2]))
+            analyze(dict(items[len(items) // 2:]))
+
+    if pending:
+        configure_gemini()
+        analyze(pending)
+    return results
@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""
+Benchmark del pipeline de análisis concurrente (modelo falso con latencia simulada)
+y de la extracción de texto en paralelo sobre los PDFs de CV/
+"""
+
+import argparse
+import glob
+import json
+import os
+import time
+
+from pipeline import run_analysis
+from extraction import extract_pdf_texts
+from database import create_table
+
+def make_fake_model(latency):
+    """Devuelve una función con la firma de analyze_cv que simula la latencia de Gemini"""
+    def fake_analyze_cv(cv_text, job_description):
+        time.sleep(latency)
+        return json.dumps({"nombre_candidato": "Fake", "email": "N/A", "score_fit": 5.0})
+    return fake_analyze_cv
+
+def make_fake_batch_model(latency, per_cv_latency):
+    """Igual que make_fake_model con la firma de analyze_cvs: latencia fija por petición más un costo por CV"""
+    def fake_analyze_cvs(cv_texts, job_description):
+        time.sleep(latency + per_cv_latency * len(cv_texts))
+        return {cv_id: json.dumps({"nombre_candidato": "Fake", "email": "N/A", "score_fit": 5.0})
+                for cv_id in cv_texts}
+    return fake_analyze_cvs
+
+def bench_analysis(cv_dir, workers_list, latency, batch_size=1, per_cv_latency=0.0):
+    """Mide el throughput del pipeline para cada número de workers"""
+    cvs = [(os.path.basename(path), path, 0) for path in sorted(glob.glob(os.path.join(cv_dir, "*.pdf")))]
+    print(f"📄 {len(cvs)} CVs en {cv_dir}, latencia simulada {latency:.2f}s, {batch_size} CVs por petición")
+
+    fake_model = make_fake_model(latency + per_cv_latency)
+    fake_batch_model = make_fake_batch_model(latency, per_cv_latency)
+    for workers in workers_list:
+        start = time.perf_counter()
+        analyses = run_analysis(cvs, {0: "job"}, workers, analyze_fn=fake_model,
+                                batch_size=batch_size, analyze_batch_fn=fake_batch_model)
+        errors = [name for name, _, _, error in analyses if error]
+        elapsed = time.perf_counter() - start
+        print(f"   workers={workers:<3} {elapsed:6.2f}s  {len(cvs) / elapsed:6.2f} CVs/s  errores={len(errors)}")
+
+def bench_extraction(cv_dir, workers_list):
+    """Mide la extracción de texto sin caché para cada número de procesos"""
+    paths = sorted(glob.glob(os.path.join(cv_dir, "*.pdf")))
+    print(f"📄 Extracción de {len(paths)} PDFs en {cv_dir}")
+
+    for workers in workers_list:
+        start = time.perf_counter()
+        slowest = (0.0, None)
+        errors = []
+        for path, _, _, error in extract_pdf_texts(paths, max_workers=workers):
+            finished = time.perf_counter() - start
+            slowest = max(slowest, (finished, os.path.basename(path)))
+            if error:
+                errors.append(os.path.basename(path))
+        elapsed = time.perf_counter() - start
+        print(f"   procesos={workers:<3} {elapsed:6.2f}s  último: {slowest[1]}  errores={errors}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--cv-dir", default="CV")
+    parser.add_argument("--workers", default="1,2,4,8")
+    parser.add_argument("--latency", type=float, default=0.5)
+    parser.add_argument("--per-cv-latency", type=float, default=0.1, help="Latencia adicional por cada CV de la petición")
+    parser.add_argument("--batch-size", type=int, default=1, help="CVs por petición")
+    parser.add_argument("--extraction", action="store_true", help="Medir solo la extracción de texto")
+    args = parser.parse_args()
+
+    workers_list = [int(w) for w in args.workers.split(",")]
+    if args.extraction:
+        bench_extraction(args.cv_dir, workers_list)
+    else:
+        create_table()
+        bench_analysis(args.cv_dir, workers_list, args.latency, args.batch_size, args.per_cv_latency)
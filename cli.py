@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+"""
+Análisis masivo de CVs por línea de comandos, sin Streamlit.
+
+Ejemplo:
+    python cli.py CV/ --job oferta.txt --workers 8 --jsonl resultados.jsonl
+
+Con --batch-size N se envían N CVs por petición y la oferta y las instrucciones
+se mandan una vez por lote en lugar de una vez por CV.
+
+Con varios --job cada CV se analiza contra cada oferta, extrayendo su texto una sola vez.
+Cada oferta se identifica por su título (--job titulo=archivo, o el nombre del archivo):
+al editar el archivo se actualiza la misma oferta y solo sus análisis quedan desactualizados.
+
+Los resultados se guardan a medida que termina cada CV, así que si el proceso
+se interrumpe basta con volver a ejecutar el mismo comando para continuar.
+"""
+
+import argparse
+import json
+import os
+import sys
+import zipfile
+
+import database
+from analyzer import load_analysis_json, get_usage_stats
+from ingest import ingest_folder, ingest_zip
+from compaction import CV_MAX_TOKENS
+from pipeline import (run_analysis, AnalysisWriter, DEFAULT_WORKERS, DEFAULT_BATCH_SIZE, job_stamps,
+                      mark_stale_analyses, prioritize)
+
+def load_done_from_jsonl(jsonl_path):
+    """Pares (CV, oferta) ya presentes en un archivo JSONL de resultados"""
+    done = set()
+    if not os.path.exists(jsonl_path):
+        return done
+    with open(jsonl_path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                result = json.loads(line)
+                done.add((result["cv_name"], result.get("job_id")))
+            except (json.JSONDecodeError, KeyError):
+                pass # Línea incompleta de una ejecución interrumpida
+    return done
+
+def select_pending(cv_dir, job_ids, save_db, jsonl_path, stale=False):
+    """Registra los PDFs del directorio (o ZIP) y devuelve los pares (CV, oferta) que faltan analizar.
+
+    Con `stale` también devuelve, al final, los análisis desactualizados (de mayor a menor score).
+    """
+    if zipfile.is_zipfile(cv_dir):
+        results = ingest_zip(cv_dir)
+    else:
+        results = ingest_folder(cv_dir)
+    cvs = [(name, path) for status, name, path in results if status != "skipped"]
+
+    pending = [(name, path, job_id) for name, path in cvs for job_id in job_ids]
+    if save_db:
+        missing = {(name, job_id) for name, _, job_id in database.get_missing_analyses(tuple(job_ids))}
+        pending = [(name, path, job_id) for name, path, job_id in pending if (name, job_id) in missing]
+    if jsonl_path:
+        done = load_done_from_jsonl(jsonl_path)
+        pending = [(name, path, job_id) for name, path, job_id in pending if (name, job_id) not in done]
+    if save_db and stale:
+        names = {name for name, _ in cvs}
+        pending += [cell for cell in database.get_stale_analyses(tuple(job_ids)) if cell[0] in names]
+    return cvs, pending
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Analiza un directorio de CVs en PDF contra una oferta de trabajo")
+    parser.add_argument("cv_dir", help="Directorio o archivo ZIP con los CVs en PDF")
+    parser.add_argument("--job", required=True, action="append",
+                        help="Archivo de texto con la descripción del puesto, opcionalmente como titulo=archivo "
+                             "(por defecto el título es el nombre del archivo; se puede repetir)")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS, help="CVs analizados en paralelo")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE,
+                        help="CVs de una misma oferta enviados en una sola petición")
+    parser.add_argument("--max-tokens", type=int, default=CV_MAX_TOKENS,
+                        help="Tokens aproximados máximos del texto de cada CV (0 = sin límite)")
+    parser.add_argument("--min-relevance", type=float, default=0.0,
+                        help="Omitir CVs cuya coincidencia de palabras clave con la oferta sea menor a esta fracción de la del mejor CV (0-1)")
+    parser.add_argument("--top-k", type=int, help="Analizar solo los K CVs más relevantes de cada oferta")
+    parser.add_argument("--db", default=database.DB_PATH, help="Base de datos SQLite")
+    parser.add_argument("--jsonl", help="Archivo JSONL donde agregar los resultados")
+    parser.add_argument("--no-db", action="store_true", help="Guardar los análisis solo en el JSONL (los CVs, las ofertas y el texto extraído siguen usando --db)")
+    parser.add_argument("--stale", action="store_true",
+                        help="Volver a analizar también los análisis hechos con otra versión de la oferta o del prompt")
+    args = parser.parse_args(argv)
+
+    if args.no_db and not args.jsonl:
+        parser.error("--no-db requiere --jsonl")
+
+    job_descriptions = {}
+    for job in args.job:
+        title, _, job_path = job.partition("=") if "=" in job and not os.path.exists(job) else ("", "", job)
+        title = title.strip() or os.path.splitext(os.path.basename(job_path))[0]
+        with open(job_path, encoding="utf-8") as f:
+            job_descriptions[title] = f.read().strip()
+        if not job_descriptions[title]:
+            parser.error(f"{job_path} está vacío")
+
+    database.DB_PATH = args.db
+    database.create_table()
+    # Una oferta editada conserva su id: mark_stale_analyses marca solo sus análisis
+    jobs = {database.get_or_create_job(title, description): description
+            for title, description in job_descriptions.items()}
+    mark_stale_analyses()
+
+    cvs, pending = select_pending(args.cv_dir, list(jobs), not args.no_db, args.jsonl, args.stale)
+    print(f"📄 {len(cvs)} CVs en {args.cv_dir} × {len(jobs)} ofertas, {len(pending)} análisis pendientes")
+    if not pending:
+        return 0
+    # Los CVs más relevantes para cada oferta se analizan primero
+    ranked, _ = prioritize(pending, jobs, args.min_relevance, args.top_k)
+    if len(ranked) < len(pending):
+        print(f"🔎 {len(pending) - len(ranked)} análisis omitidos por baja relevancia")
+    pending = ranked
+    if not pending:
+        return 0
+
+    jsonl_file = open(args.jsonl, "a", encoding="utf-8") if args.jsonl else None
+    successful_analyses = 0
+    errors = []
+    writer = AnalysisWriter(job_stamps(jobs))
+    # Tokens (originales, compactados) de cada PDF, informados por el pipeline al compactar
+    compaction = {}
+    cv_paths = {cv_name: cv_path for cv_name, cv_path, _ in pending}
+    analyses = run_analysis(pending, jobs, args.workers, batch_size=args.batch_size, max_cv_tokens=args.max_tokens,
+                            on_compacted=lambda cv_path, *tokens: compaction.__setitem__(cv_path, tokens))
+    try:
+        for i, (cv_name, job_id, analysis_result, error) in enumerate(analyses, 1):
+            try:
+                if error:
+                    raise error
+                analysis_data = database.normalize_analysis(load_analysis_json(analysis_result))
+
+                if not args.no_db:
+                    writer.add(cv_name, job_id, analysis_data)
+                if jsonl_file:
+                    jsonl_file.write(json.dumps({"cv_name": cv_name, "job_id": job_id, "analysis": analysis_data},
+                                                ensure_ascii=False) + "\n")
+                    jsonl_file.flush()
+
+                successful_analyses += 1
+                original_tokens, compacted_tokens = compaction.get(cv_paths[cv_name], (0, 0))
+                print(f"[{i}/{len(pending)}] ✅ {cv_name} ({analysis_data.get('score_fit', 0.0)}, "
+                      f"{original_tokens - compacted_tokens} tokens ahorrados)")
+            except Exception as e:
+                errors.append(cv_name)
+                print(f"[{i}/{len(pending)}] ❌ {cv_name}: {e}", file=sys.stderr)
+    finally:
+        # Stop queued Gemini calls first, then write pending analyses even on Ctrl+C so a rerun resumes after them
+        analyses.close()
+        writer.flush()
+        if jsonl_file:
+            jsonl_file.close()
+    # Análisis que la base rechazó al guardar el grupo
+    for cv_name, job_id, e in writer.failed:
+        successful_analyses -= 1
+        errors.append(cv_name)
+        print(f"❌ {cv_name}: no se pudo guardar el análisis: {e}", file=sys.stderr)
+
+    print(f"Análisis completo: {successful_analyses} de {len(pending)} análisis correctos.")
+    if compaction:
+        original_tokens = sum(tokens[0] for tokens in compaction.values())
+        compacted_tokens = sum(tokens[1] for tokens in compaction.values())
+        print(f"Compactación: {original_tokens} → {compacted_tokens} tokens en {len(compaction)} CVs")
+    usage = get_usage_stats()
+    if usage["requests"]:
+        print(f"Gemini: {usage['requests']} peticiones, {usage['prompt_tokens']} tokens de entrada "
+              f"({usage['cached_tokens']} en caché), {usage['output_tokens']} de salida, "
+              f"{usage['throttled']} respuestas 429 y {usage['retries']} reintentos")
+    return 1 if errors else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,198 @@
+import math
+import os
+import re
+import unicodedata
+
+# Approximate token budget for the CV text sent to the model (0 disables truncation)
+CV_MAX_TOKENS = int(os.getenv("CV_MAX_TOKENS", "4000"))
+# Rough characters per token for Spanish/English text, used to estimate prompt size
+CHARS_PER_TOKEN = 4
+
+PAGE_BREAK = "\f"
+# Lines at the top and bottom of each page checked for repeated headers and footers
+HEADER_FOOTER_LINES = 3
+
+_PAGE_NUMBER = re.compile(r"^(?:p[aá]g(?:ina)?\.?|page)?\s*-?\s*\d{1,3}\s*(?:(?:/|de|of)\s*\d{1,3})?\s*-?$", re.IGNORECASE)
+# Page references inside a header or footer line ("CV Ana Gómez - Página 2 de 3"), matched on folded text
+_PAGE_REFERENCE = re.compile(r"\b(?:pag(?:ina)?\.?|page)\s*\d{1,3}(?:\s*(?:/|de|of)\s*\d{1,3})?\b|\b\d{1,3}\s*(?:/|de|of)\s*\d{1,3}$")
+# A word broken across lines; the hyphen is only dropped if the joined word appears elsewhere in the CV
+_HYPHENATED = re.compile(r"(\w+)-\n[ \t]*([a-záéíóúüñ]\w*)")
+_WORD = re.compile(r"\w+")
+_SPACES = re.compile(r"[ \t\u00a0\u2000-\u200b\u3000]+")
+_BLANK_LINES = re.compile(r"\n{3,}")
+
+# Section headings (lowercase, no accents) and how much of the budget they deserve
+_SECTION_WEIGHTS = {
+    "perfil": 2, "resumen": 2, "profile": 2, "summary": 2, "sobre mi": 2, "about me": 2, "objetivo": 2,
+    "experiencia": 3, "experiencia laboral": 3, "experiencia profesional": 3, "experience": 3,
+    "work experience": 3, "professional experience": 3, "employment": 3,
+    "habilidades": 2, "competencias": 2, "skills": 2, "conocimientos": 2, "aptitudes": 2,
+    "formacion": 2, "educacion": 2, "formacion academica": 2, "estudios": 2, "education": 2,
+    "idiomas": 1, "languages": 1, "certificaciones": 1, "certifications": 1, "cursos": 1, "courses": 1,
+    "proyectos": 1, "projects": 1, "logros": 1, "achievements": 1,
+    "referencias": 0.25, "references": 0.25, "intereses": 0.25, "interests": 0.25, "hobbies": 0.25,
+    "publicaciones": 0.5, "publications": 0.5, "portfolio": 0.5, "portafolio": 0.5,
+    "voluntariado": 0.5, "volunteering": 0.5,
+}
+# Text before the first heading: name, contact details and headline
+_HEADER_WEIGHT = 3
+
+def estimate_tokens(text):
+    """Approximate token count of a text, without calling the model"""
+    return math.ceil(len(text) / CHARS_PER_TOKEN) if text else 0
+
+def _fold(line):
+    """Lowercase, accent-free form of a line for comparisons"""
+    line = unicodedata.normalize("NFKD", line.lower())
+    return "".join(ch for ch in line if not unicodedata.combining(ch)).strip(" :.-•*\t")
+
+def _join_hyphenated(text):
+    """Rejoin words split across lines, keeping the hyphen of compounds such as "full-\nstack"."""
+    words = {word.lower() for word in _WORD.findall(text)}
+
+    def join(match):
+        head, tail = match.groups()
+        separator = "" if (head + tail).lower() in words else "-"
+        return head + separator + tail
+
+    return _HYPHENATED.sub(join, text)
+
+def _normalize_page(page):
+    return [_SPACES.sub(" ", line).strip() for line in page.split("\n")]
+
+def _boilerplate_key(line, position):
+    """Comparison key of an edge line: its position plus its folded text, with page references masked"""
+    return position, _PAGE_REFERENCE.sub("#", _fold(line))
+
+def _edge_lines(lines, depth=HEADER_FOOTER_LINES):
+    """{index: "top" or "bottom"} for the first and last non-empty lines of a page, where headers and footers live.
+
+    On short pages the zones shrink so they never overlap and body lines stay out of them.
+    """
+    filled = [i for i, line in enumerate(lines) if line]
+    depth = min(depth, len(filled) // 2)
+    edges = {i: "top" for i in filled[:depth]}
+    edges.update((i, "bottom") for i in filled[len(filled) - depth:])
+    return edges
+
+def _remove_page_numbers(pages):
+    """Drop page numbers among the top and bottom lines of each page.
+
+    A bare number ("2") only counts when it is the page's own number, so values such as
+    "Años de experiencia:\n5" that end up on an edge are kept.
+    """
+    kept_pages = []
+    for number, lines in enumerate(pages, 1):
+        edge = _edge_lines(lines)
+        kept_pages.append([line for i, line in enumerate(lines)
+                           if i not in edge or not _PAGE_NUMBER.match(line) or line.isdecimal() and int(line) != number])
+    return kept_pages
+
+def _remove_repeated_lines(pages):
+    """Drop repeated headers and footers: edge lines found on at least half of the pages (two or more).
+
+    The first occurrence is kept, since headers often carry the candidate's name and contact.
+    """
+    if len(pages) < 2:
+        return pages
+    edges = [_edge_lines(lines) for lines in pages]
+    pages_with_line = {}
+    for lines, edge in zip(pages, edges):
+        for key in {_boilerplate_key(lines[i], position) for i, position in edge.items()}:
+            pages_with_line[key] = pages_with_line.get(key, 0) + 1
+    threshold = max(2, math.ceil(len(pages) / 2))
+    boilerplate = {key for key, count in pages_with_line.items() if count >= threshold}
+    seen = set()
+    kept_pages = []
+    for lines, edge in zip(pages, edges):
+        kept = []
+        for i, line in enumerate(lines):
+            key = _boilerplate_key(line, edge[i]) if i in edge else None
+            if key in boilerplate:
+                if key in seen:
+                    continue
+                seen.add(key)
+            kept.append(line)
+        kept_pages.append(kept)
+    return kept_pages
+
+def _section_weight(line):
+    """Budget weight if `line` is a section heading, None otherwise"""
+    if not line or len(line) > 40:
+        return None
+    return _SECTION_WEIGHTS.get(_fold(line))
+
+def _split_sections(text):
+    """Split a CV into [weight, lines] sections at recognized headings"""
+    sections = [[_HEADER_WEIGHT, []]]
+    for line in text.split("\n"):
+        weight = _section_weight(line)
+        if weight is not None:
+            sections.append([weight, []])
+        sections[-1][1].append(line)
+    return [section for section in sections if any(section[1])]
+
+def _allocate(sizes, weights, budget):
+    """Split `budget` across sections by weight, giving what small sections leave over to the rest"""
+    allocation = [None] * len(sizes)
+    remaining = set(range(len(sizes)))
+    while remaining:
+        total_weight = sum(weights[i] for i in remaining)
+        share = {i: budget * weights[i] / total_weight for i in remaining}
+        fitting = {i for i in remaining if sizes[i] <= share[i]}
+        if not fitting:
+            for i in remaining:
+                allocation[i] = int(share[i])
+            break
+        for i in fitting:
+            allocation[i] = sizes[i]
+            budget -= sizes[i]
+        remaining -= fitting
+    return allocation
+
+def _truncate(lines, max_chars):
+    """Keep the start of a section up to `max_chars`, cutting the line that overflows at a word boundary"""
+    kept, used = [], 0
+    for line in lines:
+        if used + len(line) + 1 > max_chars:
+            room = max_chars - used - 1
+            if room > 0:
+                cut = line[:room] if line[room] == " " else line[:room].rsplit(" ", 1)[0]
+                if cut.strip():
+                    kept.append(cut.rstrip())
+            kept.append("[...]")
+            break
+        kept.append(line)
+        used += len(line) + 1
+    return kept
+
+def _fit_budget(text, max_tokens):
+    """Truncate sections so the text fits `max_tokens`, favoring experience, skills and education"""
+    sections = _split_sections(text)
+    sizes = [len("\n".join(lines)) + 1 for _, lines in sections]
+    allocation = _allocate(sizes, [weight for weight, _ in sections], max_tokens * CHARS_PER_TOKEN)
+    kept = []
+    for (_, lines), size, max_chars in zip(sections, sizes, allocation):
+        kept.extend(lines if size <= max_chars else _truncate(lines, max_chars))
+    return "\n".join(kept)
+
+def compact_cv_text(text, max_tokens=CV_MAX_TOKENS):
+    """Deterministically shrink extracted CV text before prompting.
+
+    Normalizes whitespace, rejoins hyphenated words, drops page numbers and
+    headers/footers repeated across pages (pages are separated by form feeds)
+    and, above `max_tokens`, truncates each section to its share of the budget.
+    Returns (compacted_text, original_tokens, compacted_tokens).
+    """
+    original_tokens = estimate_tokens(text)
+    text = _join_hyphenated((text or "").replace("\r\n", "\n").replace("\r", "\n"))
+    pages = _remove_repeated_lines(_remove_page_numbers([_normalize_page(page) for page in text.split(PAGE_BREAK)]))
+    compacted = []
+    for line in (line for lines in pages for line in lines):
+        if line and compacted and line == compacted[-1]:
+            continue
+        compacted.append(line)
+    compacted = _BLANK_LINES.sub("\n\n", "\n".join(compacted)).strip()
+    if max_tokens and estimate_tokens(compacted) > max_tokens:
+        compacted = _fit_budget(compacted, max_tokens)
+    return compacted, original_tokens, estimate_tokens(compacted)
@@ -1,14 +1,131 @@
 
+import functools
+import os
+import queue
+import re
+import threading
+import unicodedata
 import sqlite3
 import json
+from collections import OrderedDict
+from contextlib import contextmanager
+
+DB_PATH = os.getenv("CV_DATABASE_PATH", "cv_database.db")
+
+# Idle connections per database path, reused across calls, reruns and threads
+_pool = {}
+_pool_pid = os.getpid()
 
 def create_connection():
-    conn = sqlite3.connect('cv_database.db')
+    """Open a new connection tuned for concurrent reads during batch writes"""
+    conn = sqlite3.connect(DB_PATH, timeout=30, check_same_thread=False, cached_statements=256)
+    conn.execute("PRAGMA journal_mode = WAL") # Readers don't block the writer and vice versa
+    conn.execute("PRAGMA synchronous = NORMAL") # No fsync per commit, only at checkpoints
+    conn.execute("PRAGMA cache_size = -20000") # 20 MB page cache
+    conn.execute("PRAGMA mmap_size = 268435456")
+    conn.execute("PRAGMA temp_store = MEMORY")
     return conn
 
-def create_table():
-    conn = create_connection()
-    c = conn.cursor()
+@contextmanager
+def get_connection():
+    """Borrow a pooled connection; commits on success and rolls back on error"""
+    global _pool, _pool_pid
+    if _pool_pid != os.getpid():
+        # Connections must not be shared with a forked child
+        _pool, _pool_pid = {}, os.getpid()
+
+    idle = _pool.setdefault(DB_PATH, queue.LifoQueue())
+    try:
+        conn = idle.get_nowait()
+    except queue.Empty:
+        conn = create_connection()
+
+    try:
+        yield conn
+        if conn.in_transaction:
+            conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    finally:
+        idle.put(conn)
+
+# --- Data version and read cache ---
+# Every write function bumps data_version.version in its own transaction. Cached reads
+# are keyed on that version, so they stay valid across reruns and sessions until any
+# session or process writes. The version row is only re-read when the database files
+# change on disk (or this process wrote), so unchanged reruns run no SQL at all.
+
+READ_CACHE_SIZE = 256
+_read_cache = OrderedDict()
+_read_cache_lock = threading.Lock()
+_local_writes = 0
+_version_state = {}
+
+def _bump_data_version(c):
+    global _local_writes
+    c.execute("UPDATE data_version SET version = version + 1 WHERE id = 1")
+    with _read_cache_lock:
+        _local_writes += 1
+
+def _file_signature():
+    signature = [_local_writes]
+    for path in (DB_PATH, DB_PATH + "-wal"):
+        try:
+            stat = os.stat(path)
+            signature.append((stat.st_mtime_ns, stat.st_size))
+        except OSError:
+            signature.append(None)
+    return tuple(signature)
+
+def get_data_version():
+    """Current data version of the database"""
+    # Take the signature before reading, so a concurrent commit can only make us re-read later
+    signature = _file_signature()
+    state = _version_state.get(DB_PATH)
+    if state and state[0] == signature:
+        return state[1]
+
+    with get_connection() as conn:
+        c = conn.cursor()
+        c.execute("SELECT version FROM data_version WHERE id = 1")
+        version = c.fetchone()[0]
+    _version_state[DB_PATH] = (signature, version)
+    return version
+
+def cached_read(func):
+    """Cache a read function's result until the data version changes.
+
+    Results are shared between sessions and must not be mutated by callers.
+    """
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        key = (DB_PATH, func.__name__, args, tuple(sorted(kwargs.items())))
+        version = get_data_version()
+        with _read_cache_lock:
+            entry = _read_cache.get(key)
+            if entry and entry[0] == version:
+                _read_cache.move_to_end(key)
+                return entry[1]
+
+        result = func(*args, **kwargs)
+        with _read_cache_lock:
+            _read_cache[key] = (version, result)
+            _read_cache.move_to_end(key)
+            while len(_read_cache) > READ_CACHE_SIZE:
+                _read_cache.popitem(last=False)
+        return result
+    return wrapper
+
+# --- Schema migrations ---
+
+def _add_column_if_missing(c, table, column_name, column_type):
+    c.execute(f"PRAGMA table_info({table})")
+    if column_name not in {row[1] for row in c.fetchall()}:
+        c.execute(f"ALTER TABLE {table} ADD COLUMN {column_name} {column_type}")
+
+def _migration_1(c):
+    """Base tables"""
     c.execute('''
         CREATE TABLE IF NOT EXISTS cvs (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -19,24 +136,12 @@ def create_table():
             email TEXT
         )
     ''')
-    # Add columns if they don't exist (for existing databases)
-    try:
-        c.execute("ALTER TABLE cvs ADD COLUMN full_name TEXT")
-    except sqlite3.OperationalError:
-        pass # Column already exists
-    try:
-        c.execute("ALTER TABLE cvs ADD COLUMN email TEXT")
-    except sqlite3.OperationalError:
-        pass # Column already exists
-
     c.execute('''
         CREATE TABLE IF NOT EXISTS job_description (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             description TEXT NOT NULL
         )
     ''')
-    
-    # Create new table for analysis results
     c.execute('''
         CREATE TABLE IF NOT EXISTS cv_analysis (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -58,193 +163,1163 @@ def create_table():
             FOREIGN KEY (cv_name) REFERENCES cvs (name)
         )
     ''')
-    
-    # Add new columns to existing cv_analysis table if they don't exist
-    new_columns = [
+
+def _migration_2(c):
+    """Columns added after the first release, for databases created before them"""
+    _add_column_if_missing(c, "cvs", "full_name", "TEXT")
+    _add_column_if_missing(c, "cvs", "email", "TEXT")
+    for column_name, column_type in [
         ("score_fit", "REAL"),
         ("nivel_experiencia", "TEXT"),
         ("tiempo_experiencia", "TEXT"),
         ("recomendacion", "TEXT"),
         ("riesgos", "TEXT"),
         ("fortalezas", "TEXT")
-    ]
-    
-    for column_name, column_type in new_columns:
-        try:
-            c.execute(f"ALTER TABLE cv_analysis ADD COLUMN {column_name} {column_type}")
-        except sqlite3.OperationalError:
-            pass # Column already exists
-    
-    conn.commit()
-    conn.close()
-
-def update_cv_analysis(cv_name, full_name, email):
-    conn = create_connection()
-    c = conn.cursor()
-    c.execute("UPDATE cvs SET analyzed = 1, full_name = ?, email = ? WHERE name = ?", (full_name, email, cv_name))
-    conn.commit()
-    conn.close()
-
-def save_analysis_result(cv_name, analysis_data):
-    """Save complete analysis result to database"""
-    conn = create_connection()
-    c = conn.cursor()
-    
+    ]:
+        _add_column_if_missing(c, "cv_analysis", column_name, column_type)
+
+def _migration_3(c):
+    """Extracted PDF text storage"""
+    # Extracted PDF text, stored once per distinct file content
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS cv_text (
+            content_hash TEXT PRIMARY KEY,
+            text TEXT NOT NULL,
+            page_count INTEGER,
+            extracted_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    # Last seen size/mtime of each file, so unchanged files are not even re-hashed
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS cv_file_stat (
+            path TEXT PRIMARY KEY,
+            size INTEGER NOT NULL,
+            mtime REAL NOT NULL,
+            content_hash TEXT NOT NULL
+        )
+    ''')
+
+def _migration_4(c):
+    """One row per CV name in cvs and cv_analysis, plus lookup/sort indexes"""
+    # Keep the latest analysis of each CV
+    c.execute('''
+        DELETE FROM cv_analysis WHERE id NOT IN (
+            SELECT MAX(id) FROM cv_analysis GROUP BY cv_name
+        )
+    ''')
+    # Keep one registration per name, preferring the analyzed one
+    c.execute('''
+        DELETE FROM cvs WHERE id IN (
+            SELECT id FROM (
+                SELECT id, ROW_NUMBER() OVER (PARTITION BY name ORDER BY analyzed DESC, id) AS rn FROM cvs
+            ) WHERE rn > 1
+        )
+    ''')
+    c.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_cvs_name ON cvs (name)")
+    c.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_cv_analysis_cv_name ON cv_analysis (cv_name)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_cv_analysis_score_fit ON cv_analysis (score_fit)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_cv_analysis_analysis_date ON cv_analysis (analysis_date)")
+
+# Keeps cv_analysis_fts in sync; also indexes the CV's extracted text when it is stored
+_FTS_INSERT = '''
+    INSERT INTO cv_analysis_fts (rowid, name, summary, skills, experience, cv_text)
+    VALUES (new.id, new.nombre_candidato, new.resumen_idoneidad, new.habilidades_coincidentes,
+            new.experiencia_coincidente,
+            (SELECT t.text FROM cvs
+             JOIN cv_file_stat f ON f.path = cvs.path
+             JOIN cv_text t ON t.content_hash = f.content_hash
+             WHERE cvs.name = new.cv_name));
+'''
+
+def _migration_5(c):
+    """Full-text search index over analysis content, accent-insensitive with prefix queries"""
+    c.execute('''
+        CREATE VIRTUAL TABLE IF NOT EXISTS cv_analysis_fts USING fts5(
+            name, summary, skills, experience, cv_text,
+            tokenize = 'unicode61 remove_diacritics 2',
+            prefix = '2 3'
+        )
+    ''')
+    c.execute(f"CREATE TRIGGER IF NOT EXISTS cv_analysis_fts_insert AFTER INSERT ON cv_analysis BEGIN {_FTS_INSERT} END")
+    c.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS cv_analysis_fts_update AFTER UPDATE ON cv_analysis BEGIN
+            DELETE FROM cv_analysis_fts WHERE rowid = old.id;
+            {_FTS_INSERT}
+        END
+    ''')
+    c.execute('''
+        CREATE TRIGGER IF NOT EXISTS cv_analysis_fts_delete AFTER DELETE ON cv_analysis BEGIN
+            DELETE FROM cv_analysis_fts WHERE rowid = old.id;
+        END
+    ''')
+    c.execute("DELETE FROM cv_analysis_fts")
+    c.execute('''
+        INSERT INTO cv_analysis_fts (rowid, name, summary, skills, experience, cv_text)
+        SELECT a.id, a.nombre_candidato, a.resumen_idoneidad, a.habilidades_coincidentes,
+               a.experiencia_coincidente, t.text
+        FROM cv_analysis a
+        LEFT JOIN cvs ON cvs.name = a.cv_name
+        LEFT JOIN cv_file_stat f ON f.path = cvs.path
+        LEFT JOIN cv_text t ON t.content_hash = f.content_hash
+    ''')
+
+# List columns of cv_analysis normalized into analysis_item, by kind
+ITEM_KINDS = {
+    "skill": "habilidades_coincidentes",
+    "experience": "experiencia_coincidente",
+    "improvement": "puntos_de_mejora",
+    "risk": "riesgos",
+    "strength": "fortalezas"
+}
+
+def normalize_item(value):
+    """Lowercase, accent-free, single-spaced form used to group list items"""
+    value = unicodedata.normalize("NFKD", str(value))
+    value = "".join(ch for ch in value if not unicodedata.combining(ch))
+    return " ".join(value.lower().split()).strip(" .;,")
+
+def _save_analysis_items(c, analysis_id, items_by_kind):
+    """Replace the normalized list items of one analysis"""
+    c.execute("DELETE FROM analysis_item WHERE analysis_id = ?", (analysis_id,))
+    rows = []
+    for kind, items in items_by_kind.items():
+        seen = set()
+        for item in items or []:
+            normalized = normalize_item(item)
+            if normalized and normalized not in seen:
+                seen.add(normalized)
+                rows.append((analysis_id, kind, str(item).strip(), normalized))
+    c.executemany("INSERT INTO analysis_item (analysis_id, kind, value, normalized) VALUES (?, ?, ?, ?)", rows)
+
+def _migration_6(c):
+    """Skills, experience, improvements, risks and strengths as indexed rows"""
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS analysis_item (
+            analysis_id INTEGER NOT NULL,
+            kind TEXT NOT NULL,
+            value TEXT NOT NULL,
+            normalized TEXT NOT NULL,
+            FOREIGN KEY (analysis_id) REFERENCES cv_analysis (id)
+        )
+    ''')
+    c.execute("CREATE INDEX IF NOT EXISTS idx_analysis_item_kind_normalized ON analysis_item (kind, normalized)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_analysis_item_analysis_id ON analysis_item (analysis_id)")
+    c.execute('''
+        CREATE TRIGGER IF NOT EXISTS analysis_item_delete AFTER DELETE ON cv_analysis BEGIN
+            DELETE FROM analysis_item WHERE analysis_id = old.id;
+        END
+    ''')
+
+    c.execute(f"SELECT id, {', '.join(ITEM_KINDS.values())} FROM cv_analysis")
+    for row in c.fetchall():
+        _save_analysis_items(c, row[0], {kind: _safe_json_loads(value) for kind, value in zip(ITEM_KINDS, row[1:])})
+
+def _score_counters(row, sign):
+    """SET clause adding (sign=+1) or removing (sign=-1) one analysis row from a stats row's counters"""
+    score = f"COALESCE({row}.score_fit, 0)"
+    return f'''
+            total = total + {sign},
+            score_sum = score_sum + {sign} * {score},
+            high_scores = high_scores + {sign} * ({score} >= 7.0),
+            excellent = excellent + {sign} * ({score} >= 8.0),
+            good = good + {sign} * ({score} >= 6.0 AND {score} < 8.0),
+            moderate = moderate + {sign} * ({score} >= 4.0 AND {score} < 6.0),
+            low = low + {sign} * ({score} < 4.0)'''
+
+def _has_candidate_name(row):
+    return f"{row}.nombre_candidato IS NOT NULL AND {row}.nombre_candidato NOT IN ('', 'N/A')"
+
+def _stats_delta(row, sign):
+    """Trigger statements adding (sign=+1) or removing (sign=-1) one analysis row from the stats"""
+    has_name = _has_candidate_name(row)
+    counter_sql = f"UPDATE analysis_stats SET {_score_counters(row, sign)} WHERE id = 1;"
+    if sign > 0:
+        candidate_sql = f'''
+            UPDATE analysis_stats SET unique_candidates = unique_candidates + 1
+            WHERE id = 1 AND {has_name}
+              AND NOT EXISTS (SELECT 1 FROM analysis_candidate WHERE name = {row}.nombre_candidato);
+            INSERT INTO analysis_candidate (name, n) SELECT {row}.nombre_candidato, 1 WHERE {has_name}
+            ON CONFLICT (name) DO UPDATE SET n = n + 1;
+        '''
+    else:
+        candidate_sql = f'''
+            UPDATE analysis_candidate SET n = n - 1 WHERE name = {row}.nombre_candidato;
+            UPDATE analysis_stats SET unique_candidates = unique_candidates - 1
+            WHERE id = 1 AND EXISTS (SELECT 1 FROM analysis_candidate WHERE name = {row}.nombre_candidato AND n = 0);
+            DELETE FROM analysis_candidate WHERE name = {row}.nombre_candidato AND n = 0;
+        '''
+    return counter_sql + candidate_sql
+
+def _job_stats_delta(row, sign):
+    """Like _stats_delta, for the stats of the analysis row's job"""
+    has_name = _has_candidate_name(row)
+    sql = f"UPDATE job_stats SET {_score_counters(row, sign)} WHERE job_id = {row}.job_id;"
+    if sign > 0:
+        # Not INSERT OR IGNORE: inside a trigger the outer statement's conflict policy would override it
+        sql = f'''
+            INSERT INTO job_stats (job_id) SELECT {row}.job_id
+            WHERE {row}.job_id IS NOT NULL AND NOT EXISTS (SELECT 1 FROM job_stats WHERE job_id = {row}.job_id);
+        ''' + sql + f'''
+            UPDATE job_stats SET unique_candidates = unique_candidates + 1
+            WHERE job_id = {row}.job_id AND {has_name}
+              AND NOT EXISTS (SELECT 1 FROM job_candidate WHERE job_id = {row}.job_id AND name = {row}.nombre_candidato);
+            INSERT INTO job_candidate (job_id, name, n) SELECT {row}.job_id, {row}.nombre_candidato, 1
+            WHERE {row}.job_id IS NOT NULL AND {has_name}
+            ON CONFLICT (job_id, name) DO UPDATE SET n = n + 1;
+        '''
+    else:
+        sql += f'''
+            UPDATE job_candidate SET n = n - 1 WHERE job_id = {row}.job_id AND name = {row}.nombre_candidato;
+            UPDATE job_stats SET unique_candidates = unique_candidates - 1
+            WHERE job_id = {row}.job_id AND EXISTS (
+                SELECT 1 FROM job_candidate WHERE job_id = {row}.job_id AND name = {row}.nombre_candidato AND n = 0
+            );
+            DELETE FROM job_candidate WHERE job_id = {row}.job_id AND name = {row}.nombre_candidato AND n = 0;
+        '''
+    return sql
+
+def _migration_7(c):
+    """Summary statistics maintained by triggers, so the dashboard never scans cv_analysis"""
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS analysis_stats (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            total INTEGER NOT NULL DEFAULT 0,
+            score_sum REAL NOT NULL DEFAULT 0,
+            high_scores INTEGER NOT NULL DEFAULT 0,
+            excellent INTEGER NOT NULL DEFAULT 0,
+            good INTEGER NOT NULL DEFAULT 0,
+            moderate INTEGER NOT NULL DEFAULT 0,
+            low INTEGER NOT NULL DEFAULT 0,
+            unique_candidates INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+    # Analyses per candidate name, to maintain the unique candidate count
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS analysis_candidate (
+            name TEXT PRIMARY KEY,
+            n INTEGER NOT NULL
+        )
+    ''')
+    c.execute(f"CREATE TRIGGER IF NOT EXISTS analysis_stats_insert AFTER INSERT ON cv_analysis BEGIN {_stats_delta('new', 1)} END")
+    c.execute(f"CREATE TRIGGER IF NOT EXISTS analysis_stats_update AFTER UPDATE ON cv_analysis BEGIN {_stats_delta('old', -1)} {_stats_delta('new', 1)} END")
+    c.execute(f"CREATE TRIGGER IF NOT EXISTS analysis_stats_delete AFTER DELETE ON cv_analysis BEGIN {_stats_delta('old', -1)} END")
+
+    c.execute("DELETE FROM analysis_candidate")
+    c.execute('''
+        INSERT INTO analysis_candidate (name, n)
+        SELECT nombre_candidato, COUNT(*) FROM cv_analysis
+        WHERE nombre_candidato IS NOT NULL AND nombre_candidato NOT IN ('', 'N/A')
+        GROUP BY nombre_candidato
+    ''')
+    c.execute('''
+        INSERT OR REPLACE INTO analysis_stats
+            (id, total, score_sum, high_scores, excellent, good, moderate, low, unique_candidates)
+        SELECT
+            1,
+            COUNT(*),
+            COALESCE(SUM(COALESCE(score_fit, 0)), 0),
+            COALESCE(SUM(COALESCE(score_fit, 0) >= 7.0), 0),
+            COALESCE(SUM(COALESCE(score_fit, 0) >= 8.0), 0),
+            COALESCE(SUM(COALESCE(score_fit, 0) >= 6.0 AND COALESCE(score_fit, 0) < 8.0), 0),
+            COALESCE(SUM(COALESCE(score_fit, 0) >= 4.0 AND COALESCE(score_fit, 0) < 6.0), 0),
+            COALESCE(SUM(COALESCE(score_fit, 0) < 4.0), 0),
+            (SELECT COUNT(*) FROM analysis_candidate)
+        FROM cv_analysis
+    ''')
+
+def _migration_8(c):
+    """Data version counter for the read cache"""
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS data_version (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            version INTEGER NOT NULL
+        )
+    ''')
+    c.execute("INSERT OR IGNORE INTO data_version (id, version) VALUES (1, 0)")
+
+def _migration_9(c):
+    """Index for status-sorted CV listings and the unanalyzed CV lookup"""
+    c.execute("CREATE INDEX IF NOT EXISTS idx_cvs_analyzed_name ON cvs (analyzed, name)")
+
+def _migration_10(c):
+    """SHA-256 of each CV's content, so uploads are deduplicated by content instead of name"""
+    _add_column_if_missing(c, "cvs", "content_hash", "TEXT")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_cvs_content_hash ON cvs (content_hash)")
+    c.execute('''
+        UPDATE cvs SET content_hash = (SELECT content_hash FROM cv_file_stat WHERE path = cvs.path)
+        WHERE content_hash IS NULL
+    ''')
+
+def _job_title(description):
+    """First line of a job description, used as the title of jobs saved without one"""
+    first_line = next((line.strip() for line in (description or "").splitlines() if line.strip()), "")
+    return first_line[:60] or "Untitled job"
+
+def _migration_11(c):
+    """Several job records, one analysis per (CV, job) and per-job summary statistics"""
+    _add_column_if_missing(c, "job_description", "title", "TEXT")
+    _add_column_if_missing(c, "job_description", "created_at", "TIMESTAMP")
+    _add_column_if_missing(c, "cv_analysis", "job_id", "INTEGER REFERENCES job_description (id)")
+    c.execute("SELECT id, description FROM job_description WHERE title IS NULL")
+    c.executemany("UPDATE job_description SET title = ? WHERE id = ?",
+                  [(_job_title(description), job_id) for job_id, description in c.fetchall()])
+
+    # Analyses made while only one job description was kept belong to that job
+    c.execute("SELECT 1 FROM cv_analysis WHERE job_id IS NULL LIMIT 1")
+    if c.fetchone():
+        c.execute("SELECT MAX(id) FROM job_description")
+        job_id = c.fetchone()[0]
+        if job_id is None:
+            c.execute("INSERT INTO job_description (title, description) VALUES ('Untitled job', '')")
+            job_id = c.lastrowid
+        c.execute("UPDATE cv_analysis SET job_id = ? WHERE job_id IS NULL", (job_id,))
+
+    c.execute("DROP INDEX IF EXISTS idx_cv_analysis_cv_name")
+    c.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_cv_analysis_cv_name_job ON cv_analysis (cv_name, job_id)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_cv_analysis_job_score_fit ON cv_analysis (job_id, score_fit)")
+
+    # A CV registered with new content loses the analyses of its old content
+    c.execute('''
+        CREATE TRIGGER IF NOT EXISTS cvs_content_changed AFTER UPDATE OF content_hash ON cvs
+        WHEN old.content_hash IS NOT NULL AND old.content_hash != new.content_hash BEGIN
+            DELETE FROM cv_analysis WHERE cv_name = new.name;
+        END
+    ''')
+
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS job_stats (
+            job_id INTEGER PRIMARY KEY,
+            total INTEGER NOT NULL DEFAULT 0,
+            score_sum REAL NOT NULL DEFAULT 0,
+            high_scores INTEGER NOT NULL DEFAULT 0,
+            excellent INTEGER NOT NULL DEFAULT 0,
+            good INTEGER NOT NULL DEFAULT 0,
+            moderate INTEGER NOT NULL DEFAULT 0,
+            low INTEGER NOT NULL DEFAULT 0,
+            unique_candidates INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS job_candidate (
+            job_id INTEGER NOT NULL,
+            name TEXT NOT NULL,
+            n INTEGER NOT NULL,
+            PRIMARY KEY (job_id, name)
+        )
+    ''')
+    c.execute(f"CREATE TRIGGER IF NOT EXISTS job_stats_insert AFTER INSERT ON cv_analysis BEGIN {_job_stats_delta('new', 1)} END")
+    c.execute(f"CREATE TRIGGER IF NOT EXISTS job_stats_update AFTER UPDATE ON cv_analysis BEGIN {_job_stats_delta('old', -1)} {_job_stats_delta('new', 1)} END")
+    c.execute(f"CREATE TRIGGER IF NOT EXISTS job_stats_delete AFTER DELETE ON cv_analysis BEGIN {_job_stats_delta('old', -1)} END")
+
+    c.execute("DELETE FROM job_candidate")
+    c.execute('''
+        INSERT INTO job_candidate (job_id, name, n)
+        SELECT job_id, nombre_candidato, COUNT(*) FROM cv_analysis
+        WHERE nombre_candidato IS NOT NULL AND nombre_candidato NOT IN ('', 'N/A')
+        GROUP BY job_id, nombre_candidato
+    ''')
+    c.execute("DELETE FROM job_stats")
+    c.execute('''
+        INSERT INTO job_stats
+            (job_id, total, score_sum, high_scores, excellent, good, moderate, low, unique_candidates)
+        SELECT
+            job_id,
+            COUNT(*),
+            SUM(COALESCE(score_fit, 0)),
+            SUM(COALESCE(score_fit, 0) >= 7.0),
+            SUM(COALESCE(score_fit, 0) >= 8.0),
+            SUM(COALESCE(score_fit, 0) >= 6.0 AND COALESCE(score_fit, 0) < 8.0),
+            SUM(COALESCE(score_fit, 0) >= 4.0 AND COALESCE(score_fit, 0) < 6.0),
+            SUM(COALESCE(score_fit, 0) < 4.0),
+            (SELECT COUNT(*) FROM job_candidate WHERE job_candidate.job_id = cv_analysis.job_id)
+        FROM cv_analysis
+        GROUP BY job_id
+    ''')
+
+def _migration_12(c):
+    """Analyses stamped with the job description and prompt they were made with, flagged stale when either changes"""
+    _add_column_if_missing(c, "cv_analysis", "analysis_stamp", "TEXT")
+    _add_column_if_missing(c, "cv_analysis", "stale", "INTEGER NOT NULL DEFAULT 0")
+    # Stamp of each job's current description and prompt, set by update_job_stamps()
+    _add_column_if_missing(c, "job_description", "stamp", "TEXT")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_cv_analysis_job_stale ON cv_analysis (job_id, stale)")
+
+    # Flagging rows stale must not re-index them or recount the stats: only fire on the columns they use
+    c.execute("DROP TRIGGER IF EXISTS cv_analysis_fts_update")
+    c.execute(f'''
+        CREATE TRIGGER cv_analysis_fts_update
+        AFTER UPDATE OF cv_name, nombre_candidato, resumen_idoneidad, habilidades_coincidentes, experiencia_coincidente
+        ON cv_analysis BEGIN
+            DELETE FROM cv_analysis_fts WHERE rowid = old.id;
+            {_FTS_INSERT}
+        END
+    ''')
+    c.execute("DROP TRIGGER IF EXISTS analysis_stats_update")
+    c.execute(f"CREATE TRIGGER analysis_stats_update AFTER UPDATE OF score_fit, nombre_candidato ON cv_analysis BEGIN {_stats_delta('old', -1)} {_stats_delta('new', 1)} END")
+    c.execute("DROP TRIGGER IF EXISTS job_stats_update")
+    c.execute(f"CREATE TRIGGER job_stats_update AFTER UPDATE OF score_fit, nombre_candidato, job_id ON cv_analysis BEGIN {_job_stats_delta('old', -1)} {_job_stats_delta('new', 1)} END")
+    # Recreated with the job_stats row insert that also works under an upsert
+    c.execute("DROP TRIGGER IF EXISTS job_stats_insert")
+    c.execute(f"CREATE TRIGGER job_stats_insert AFTER INSERT ON cv_analysis BEGIN {_job_stats_delta('new', 1)} END")
+
+def _migration_13(c):
+    """Row of each CV in the memory-mapped similarity matrix (see similarity.py)"""
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS cv_vector (
+            cv_name TEXT PRIMARY KEY,
+            row INTEGER NOT NULL UNIQUE,
+            vector_key TEXT
+        )
+    ''')
+    # Rows of deleted CVs are left in the matrix and zeroed when a query runs into them
+    c.execute("CREATE TRIGGER IF NOT EXISTS cv_vector_cv_delete AFTER DELETE ON cvs BEGIN "
+              "DELETE FROM cv_vector WHERE cv_name = old.name; END")
+
+def _migration_14(c):
+    """Store every score as a number so sorting and score filters can use the score indexes"""
+    c.execute("UPDATE cv_analysis SET score_fit = 0 WHERE typeof(score_fit) NOT IN ('real', 'integer')")
+
+# Ordered schema migrations; the database's PRAGMA user_version is the number applied so far.
+# Never edit a released migration, append a new one instead.
+MIGRATIONS = [
+    _migration_1,
+    _migration_2,
+    _migration_3,
+    _migration_4,
+    _migration_5,
+    _migration_6,
+    _migration_7,
+    _migration_8,
+    _migration_9,
+    _migration_10,
+    _migration_11,
+    _migration_12,
+    _migration_13,
+    _migration_14,
+]
+
+# Database paths already migrated by this process
+_migrated = set()
+
+def create_table():
+    """Bring the schema up to date. Only does work once per process and database"""
+    if DB_PATH in _migrated:
+        return
+
+    with get_connection() as conn:
+        c = conn.cursor()
+        c.execute("PRAGMA user_version")
+        if c.fetchone()[0] < len(MIGRATIONS):
+            # Take the write lock before re-reading the version so concurrent processes don't migrate twice
+            c.execute("BEGIN IMMEDIATE")
+            c.execute("PRAGMA user_version")
+            version = c.fetchone()[0]
+            for migration in MIGRATIONS[version:]:
+                migration(c)
+            c.execute(f"PRAGMA user_version = {len(MIGRATIONS)}")
+            _bump_data_version(c)
+    _migrated.add(DB_PATH)
+
+def _score(value):
+    """The model's score as a float; missing or unreadable scores count as 0"""
+    try:
+        score = float(value)
+    except (TypeError, ValueError):
+        return 0.0
+    return score if score == score else 0.0 # NaN would be stored as NULL
+
+# Analysis fields stored as text and as lists (the matched skills and experience live under "analisis_match")
+_ANALYSIS_TEXT_FIELDS = ("nombre_candidato", "email", "puesto_solicitado", "nivel_experiencia", "tiempo_experiencia",
+                         "resumen_idoneidad", "recomendacion")
+_ANALYSIS_LIST_FIELDS = ("puntos_de_mejora", "riesgos", "fortalezas")
+_MATCH_LIST_FIELDS = ("habilidades_coincidentes", "experiencia_coincidente")
+
+def _as_list(value):
+    if isinstance(value, list):
+        return value
+    return [value] if isinstance(value, str) and value.strip() else []
+
+def normalize_analysis(analysis_data):
+    """Coerce a parsed model reply to the shape _write_analysis stores.
+
+    Raises ValueError unless the reply is a JSON object; fields of the wrong
+    type (a null "analisis_match", a string instead of a list) are repaired.
+    """
+    if not isinstance(analysis_data, dict):
+        raise ValueError(f"Expected a JSON object for the analysis, got {type(analysis_data).__name__}")
+    analysis_data = dict(analysis_data)
+    for field in _ANALYSIS_TEXT_FIELDS:
+        if isinstance(analysis_data.get(field), (dict, list)):
+            analysis_data[field] = json.dumps(analysis_data[field], ensure_ascii=False)
+    for field in _ANALYSIS_LIST_FIELDS:
+        analysis_data[field] = _as_list(analysis_data.get(field))
+    match = analysis_data.get("analisis_match")
+    match = match if isinstance(match, dict) else {}
+    analysis_data["analisis_match"] = {field: _as_list(match.get(field)) for field in _MATCH_LIST_FIELDS}
+    return analysis_data
+
+def _write_analysis(c, cv_name, job_id, analysis_data, stamp=None):
+    """Upsert the analysis of a CV for a job and mark the CV as analyzed, inside the caller's transaction.
+
+    `stamp` identifies the job description and prompt the analysis was made with;
+    the row is stale unless it matches the job's current stamp.
+    """
+    analysis_data = normalize_analysis(analysis_data)
+
     # Extract data from analysis_data dictionary
     nombre_candidato = analysis_data.get("nombre_candidato", "N/A")
     email = analysis_data.get("email", "N/A")
     puesto_solicitado = analysis_data.get("puesto_solicitado", "N/A")
-    score_fit = analysis_data.get("score_fit", 0.0)
+    score_fit = _score(analysis_data.get("score_fit"))
     nivel_experiencia = analysis_data.get("nivel_experiencia", "N/A")
     tiempo_experiencia = analysis_data.get("tiempo_experiencia", "N/A")
-    
+
     # Convert lists to JSON strings for storage
     habilidades_coincidentes = json.dumps(analysis_data.get("analisis_match", {}).get("habilidades_coincidentes", []), ensure_ascii=False)
     experiencia_coincidente = json.dumps(analysis_data.get("analisis_match", {}).get("experiencia_coincidente", []), ensure_ascii=False)
     puntos_de_mejora = json.dumps(analysis_data.get("puntos_de_mejora", []), ensure_ascii=False)
     riesgos = json.dumps(analysis_data.get("riesgos", []), ensure_ascii=False)
     fortalezas = json.dumps(analysis_data.get("fortalezas", []), ensure_ascii=False)
-    
+
     resumen_idoneidad = analysis_data.get("resumen_idoneidad", "N/A")
     recomendacion = analysis_data.get("recomendacion", "N/A")
-    
-    # Insert or update analysis result
+
+    # Insert or update analysis result (one row per CV and job)
     c.execute('''
-        INSERT OR REPLACE INTO cv_analysis 
-        (cv_name, nombre_candidato, email, puesto_solicitado, score_fit, nivel_experiencia, 
+        INSERT INTO cv_analysis 
+        (cv_name, job_id, nombre_candidato, email, puesto_solicitado, score_fit, nivel_experiencia, 
          tiempo_experiencia, habilidades_coincidentes, experiencia_coincidente, 
-         puntos_de_mejora, resumen_idoneidad, recomendacion, riesgos, fortalezas)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-    ''', (cv_name, nombre_candidato, email, puesto_solicitado, score_fit, nivel_experiencia, 
+         puntos_de_mejora, resumen_idoneidad, recomendacion, riesgos, fortalezas,
+         analysis_stamp, stale)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?,
+                ? IS NOT (SELECT stamp FROM job_description WHERE id = ?))
+        ON CONFLICT (cv_name, job_id) DO UPDATE SET
+            nombre_candidato = excluded.nombre_candidato,
+            email = excluded.email,
+            puesto_solicitado = excluded.puesto_solicitado,
+            score_fit = excluded.score_fit,
+            nivel_experiencia = excluded.nivel_experiencia,
+            tiempo_experiencia = excluded.tiempo_experiencia,
+            habilidades_coincidentes = excluded.habilidades_coincidentes,
+            experiencia_coincidente = excluded.experiencia_coincidente,
+            puntos_de_mejora = excluded.puntos_de_mejora,
+            resumen_idoneidad = excluded.resumen_idoneidad,
+            recomendacion = excluded.recomendacion,
+            riesgos = excluded.riesgos,
+            fortalezas = excluded.fortalezas,
+            analysis_stamp = excluded.analysis_stamp,
+            stale = excluded.stale,
+            analysis_date = CURRENT_TIMESTAMP
+    ''', (cv_name, job_id, nombre_candidato, email, puesto_solicitado, score_fit, nivel_experiencia, 
           tiempo_experiencia, habilidades_coincidentes, experiencia_coincidente, 
-          puntos_de_mejora, resumen_idoneidad, recomendacion, riesgos, fortalezas))
-    
-    conn.commit()
-    conn.close()
-
-def get_analysis_result(cv_name):
-    """Get analysis result for a specific CV"""
-    conn = create_connection()
-    c = conn.cursor()
-    c.execute("SELECT * FROM cv_analysis WHERE cv_name = ?", (cv_name,))
-    result = c.fetchone()
-    conn.close()
-    
-    if result:
-        # Helper function to safely parse JSON
-        def safe_json_loads(json_str, default=[]):
-            if not json_str or json_str.strip() == '':
-                return default
-            try:
-                return json.loads(json_str)
-            except (json.JSONDecodeError, TypeError):
-                return default
-        
-        # Convert JSON strings back to lists
-        return {
-            "cv_name": result[1],
-            "nombre_candidato": result[2] or "",
-            "email": result[3] or "",
-            "puesto_solicitado": result[4] or "",
-            "score_fit": result[5] or 0.0,
-            "nivel_experiencia": result[6] or "",
-            "tiempo_experiencia": result[7] or "",
-            "habilidades_coincidentes": safe_json_loads(result[8]),
-            "experiencia_coincidente": safe_json_loads(result[9]),
-            "puntos_de_mejora": safe_json_loads(result[10]),
-            "resumen_idoneidad": result[11] or "",
-            "recomendacion": result[12] or "",
-            "riesgos": safe_json_loads(result[13]),
-            "fortalezas": safe_json_loads(result[14]),
-            "analysis_date": result[15]
-        }
-    return None
-
-def get_all_analysis_results():
-    """Get all analysis results"""
-    conn = create_connection()
-    c = conn.cursor()
-    c.execute("SELECT * FROM cv_analysis ORDER BY analysis_date DESC")
-    results = c.fetchall()
-    conn.close()
-    
-    # Helper function to safely parse JSON
-    def safe_json_loads(json_str, default=[]):
-        if not json_str or json_str.strip() == '':
-            return default
-        try:
-            return json.loads(json_str)
-        except (json.JSONDecodeError, TypeError):
-            return default
-    
+          puntos_de_mejora, resumen_idoneidad, recomendacion, riesgos, fortalezas,
+          stamp, stamp, job_id))
+
+    # Keep the normalized list items in sync
+    c.execute("SELECT id FROM cv_analysis WHERE cv_name = ? AND job_id = ?", (cv_name, job_id))
+    _save_analysis_items(c, c.fetchone()[0], {
+        "skill": analysis_data.get("analisis_match", {}).get("habilidades_coincidentes", []),
+        "experience": analysis_data.get("analisis_match", {}).get("experiencia_coincidente", []),
+        "improvement": analysis_data.get("puntos_de_mejora", []),
+        "risk": analysis_data.get("riesgos", []),
+        "strength": analysis_data.get("fortalezas", [])
+    })
+
+    # Basic CV info shown in the CV list
+    c.execute("UPDATE cvs SET analyzed = 1, full_name = ?, email = ? WHERE name = ?", (nombre_candidato, email, cv_name))
+
+def save_analysis_result(cv_name, job_id, analysis_data, stamp=None):
+    """Save complete analysis result to database and mark the CV as analyzed"""
+    save_analysis_batch([(cv_name, job_id, analysis_data, stamp)])
+
+def save_analysis_batch(results):
+    """Save several (cv_name, job_id, analysis_data, stamp) results and their CV status in one transaction"""
+    if not results:
+        return
+    with get_connection() as conn:
+        c = conn.cursor()
+        for cv_name, job_id, analysis_data, stamp in results:
+            _write_analysis(c, cv_name, job_id, analysis_data, stamp)
+        _bump_data_version(c)
+
+# Columns read back from cv_analysis, in the order expected by _row_to_analysis
+_ANALYSIS_COLUMNS = """
+    cv_name, nombre_candidato, email, puesto_solicitado, score_fit, nivel_experiencia,
+    tiempo_experiencia, habilidades_coincidentes, experiencia_coincidente, puntos_de_mejora,
+    resumen_idoneidad, recomendacion, riesgos, fortalezas, analysis_date, job_id, stale
+"""
+
+def _safe_json_loads(json_str, default=None):
+    """Safely parse a JSON list column"""
+    if not json_str or json_str.strip() == '':
+        return default if default is not None else []
+    try:
+        return json.loads(json_str)
+    except (json.JSONDecodeError, TypeError):
+        return default if default is not None else []
+
+def _row_to_analysis(result):
+    """Convert a cv_analysis row (selected with _ANALYSIS_COLUMNS) to a dict"""
+    return {
+        "cv_name": result[0],
+        "nombre_candidato": result[1] or "",
+        "email": result[2] or "",
+        "puesto_solicitado": result[3] or "",
+        "score_fit": result[4] or 0.0,
+        "nivel_experiencia": result[5] or "",
+        "tiempo_experiencia": result[6] or "",
+        "habilidades_coincidentes": _safe_json_loads(result[7]),
+        "experiencia_coincidente": _safe_json_loads(result[8]),
+        "puntos_de_mejora": _safe_json_loads(result[9]),
+        "resumen_idoneidad": result[10] or "",
+        "recomendacion": result[11] or "",
+        "riesgos": _safe_json_loads(result[12]),
+        "fortalezas": _safe_json_loads(result[13]),
+        "analysis_date": result[14],
+        "job_id": result[15],
+        "stale": bool(result[16])
+    }
+
+@cached_read
+def get_analysis_result(cv_name, job_id=None):
+    """Get the analysis of a CV for a job, or its latest analysis for any job"""
+    with get_connection() as conn:
+        c = conn.cursor()
+        if job_id is None:
+            c.execute(f"SELECT {_ANALYSIS_COLUMNS} FROM cv_analysis WHERE cv_name = ? ORDER BY analysis_date DESC, id DESC LIMIT 1",
+                      (cv_name,))
+        else:
+            c.execute(f"SELECT {_ANALYSIS_COLUMNS} FROM cv_analysis WHERE cv_name = ? AND job_id = ?", (cv_name, job_id))
+        result = c.fetchone()
+    return _row_to_analysis(result) if result else None
+
+@cached_read
+def get_cv_analysis_jobs(cv_name):
+    """Jobs a CV has been analyzed for, as (job_id, title, score_fit), best score first"""
+    with get_connection() as conn:
+        c = conn.cursor()
+        c.execute('''
+            SELECT j.id, j.title, a.score_fit FROM cv_analysis a
+            JOIN job_description j ON j.id = a.job_id
+            WHERE a.cv_name = ?
+            ORDER BY a.score_fit DESC, j.id
+        ''', (cv_name,))
+        return c.fetchall()
+
+# Score filter buckets: label -> (min inclusive, max exclusive)
+SCORE_RANGES = {
+    "8.0-10.0 (Excellent)": (8.0, None),
+    "6.0-7.9 (Good)": (6.0, 8.0),
+    "4.0-5.9 (Moderate)": (4.0, 6.0),
+    "0.0-3.9 (Low)": (None, 4.0)
+}
+
+# Sort options: label -> ORDER BY clause
+SORT_OPTIONS = {
+    # Ties in the direction of the score index, so a page is read straight from it without sorting
+    "Score (highest first)": "score_fit DESC, id DESC",
+    "Score (lowest first)": "score_fit, id",
+    "Newest first": "analysis_date DESC, id DESC",
+    "Candidate name": "nombre_candidato COLLATE NOCASE, id",
+    "Relevance": "rank, id"
+}
+
+def _fts_query(search):
+    """Turn free text into an FTS5 query: every word must match, as a prefix"""
+    words = re.findall(r"\w+", search or "")
+    return " ".join(f'"{word}"*' for word in words)
+
+def _analysis_filters(name=None, position=None, score_range=None, search=None, skill=None, job_id=None):
+    """Build the FROM/WHERE clauses and parameters shared by listing and counting"""
+    conditions = []
+    params = []
+    if job_id is not None:
+        conditions.append("job_id = ?")
+        params.append(job_id)
+    if skill:
+        conditions.append("id IN (SELECT analysis_id FROM analysis_item WHERE kind = 'skill' AND normalized = ?)")
+        params.append(normalize_item(skill))
+    if name:
+        conditions.append("nombre_candidato = ?")
+        params.append(name)
+    if position:
+        conditions.append("puesto_solicitado = ?")
+        params.append(position)
+    if score_range in SCORE_RANGES:
+        min_score, max_score = SCORE_RANGES[score_range]
+        if min_score is not None:
+            conditions.append("score_fit >= ?")
+            params.append(min_score)
+        if max_score is not None:
+            conditions.append("score_fit < ?")
+            params.append(max_score)
+    if _fts_query(search):
+        conditions.append("cv_analysis_fts MATCH ?")
+        params.append(_fts_query(search))
+    where = "WHERE " + " AND ".join(conditions) if conditions else ""
+    from_clause = "cv_analysis"
+    if _fts_query(search):
+        from_clause += " JOIN cv_analysis_fts ON cv_analysis_fts.rowid = cv_analysis.id"
+    return from_clause, where, params
+
+@cached_read
+def query_analysis_results(name=None, position=None, score_range=None, search=None, skill=None, job_id=None,
+                           sort="Score (highest first)", limit=20, offset=0):
+    """Get one page of filtered, sorted analysis results.
+
+    With a search term, each result also has a "snippet" with the matching
+    words in bold, and sort="Relevance" orders by BM25 rank.
+    """
+    from_clause, where, params = _analysis_filters(name, position, score_range, search, skill, job_id)
+    columns = _ANALYSIS_COLUMNS
+    if _fts_query(search):
+        columns += ", snippet(cv_analysis_fts, -1, '**', '**', '…', 16)"
+    elif sort == "Relevance":
+        sort = None # Relevance only exists for a full-text search
+    order_by = SORT_OPTIONS.get(sort, SORT_OPTIONS["Score (highest first)"])
+    with get_connection() as conn:
+        c = conn.cursor()
+        c.execute(f"SELECT {columns} FROM {from_clause} {where} ORDER BY {order_by} LIMIT ? OFFSET ?",
+                  params + [limit, offset])
+        results = c.fetchall()
+
     analysis_list = []
     for result in results:
-        analysis_list.append({
-            "cv_name": result[1],
-            "nombre_candidato": result[2] or "",
-            "email": result[3] or "",
-            "puesto_solicitado": result[4] or "",
-            "score_fit": result[5] or 0.0,
-            "nivel_experiencia": result[6] or "",
-            "tiempo_experiencia": result[7] or "",
-            "habilidades_coincidentes": safe_json_loads(result[8]),
-            "experiencia_coincidente": safe_json_loads(result[9]),
-            "puntos_de_mejora": safe_json_loads(result[10]),
-            "resumen_idoneidad": result[11] or "",
-            "recomendacion": result[12] or "",
-            "riesgos": safe_json_loads(result[13]),
-            "fortalezas": safe_json_loads(result[14]),
-            "analysis_date": result[15]
-        })
+        analysis = _row_to_analysis(result)
+        if len(result) > 17:
+            analysis["snippet"] = result[17]
+        analysis_list.append(analysis)
     return analysis_list
 
-def save_job_description(description):
-    conn = create_connection()
-    c = conn.cursor()
-    c.execute("DELETE FROM job_description") # Only keep one job description
-    c.execute("INSERT INTO job_description (description) VALUES (?)", (description,))
-    conn.commit()
-    conn.close()
-
-def get_job_description():
-    conn = create_connection()
-    c = conn.cursor()
-    c.execute("SELECT description FROM job_description ORDER BY id DESC LIMIT 1")
-    result = c.fetchone()
-    conn.close()
-    return result[0] if result else ""
-
-def get_unanalyzed_cvs():
-    conn = create_connection()
-    c = conn.cursor()
-    c.execute("SELECT name, path FROM cvs WHERE analyzed = 0")
-    cvs = c.fetchall()
-    conn.close()
-    return cvs
+@cached_read
+def count_analysis_results(name=None, position=None, score_range=None, search=None, skill=None, job_id=None):
+    """Count the analysis results matching the filters"""
+    from_clause, where, params = _analysis_filters(name, position, score_range, search, skill, job_id)
+    with get_connection() as conn:
+        c = conn.cursor()
+        c.execute(f"SELECT COUNT(*) FROM {from_clause} {where}", params)
+        return c.fetchone()[0]
+
+@cached_read
+def get_item_counts(kind="skill", limit=20, job_id=None):
+    """Most frequent list items of a kind across all analyses (or one job's), as (value, count)"""
+    job_condition = "AND analysis_id IN (SELECT id FROM cv_analysis WHERE job_id = ?)" if job_id is not None else ""
+    params = [kind] + ([job_id] if job_id is not None else []) + [limit]
+    with get_connection() as conn:
+        c = conn.cursor()
+        c.execute(f'''
+            SELECT MIN(value), COUNT(DISTINCT analysis_id) AS n FROM analysis_item
+            WHERE kind = ? {job_condition}
+            GROUP BY normalized
+            ORDER BY n DESC, normalized
+            LIMIT ?
+        ''', params)
+        return c.fetchall()
+
+@cached_read
+def get_analysis_filter_options():
+    """Distinct candidate names and positions for the filter dropdowns"""
+    with get_connection() as conn:
+        c = conn.cursor()
+        c.execute("SELECT DISTINCT nombre_candidato FROM cv_analysis WHERE nombre_candidato NOT IN ('', 'N/A') ORDER BY 1")
+        names = [row[0] for row in c.fetchall()]
+        c.execute("SELECT DISTINCT puesto_solicitado FROM cv_analysis WHERE puesto_solicitado NOT IN ('', 'N/A') ORDER BY 1")
+        positions = [row[0] for row in c.fetchall()]
+    return names, positions
+
+@cached_read
+def get_analysis_summary(job_id=None):
+    """Summary statistics and score distribution of all analyses or one job's, read from the trigger-maintained stats rows"""
+    with get_connection() as conn:
+        c = conn.cursor()
+        if job_id is None:
+            c.execute('''
+                SELECT total, unique_candidates, score_sum, high_scores, excellent, good, moderate, low
+                FROM analysis_stats WHERE id = 1
+            ''')
+        else:
+            c.execute('''
+                SELECT total, unique_candidates, score_sum, high_scores, excellent, good, moderate, low
+                FROM job_stats WHERE job_id = ?
+            ''', (job_id,))
+        result = c.fetchone() or (0, 0, 0.0, 0, 0, 0, 0, 0)
+    return {
+        "total": result[0],
+        "unique_candidates": result[1],
+        "avg_score": result[2] / result[0] if result[0] else 0.0,
+        "high_scores": result[3],
+        "score_distribution": dict(zip(SCORE_RANGES, result[4:8]))
+    }
+
+def create_job(title, description):
+    """Add a job record, returns its id"""
+    with get_connection() as conn:
+        c = conn.cursor()
+        c.execute("INSERT INTO job_description (title, description, created_at) VALUES (?, ?, CURRENT_TIMESTAMP)",
+                  (title.strip() or _job_title(description), description))
+        _bump_data_version(c)
+        return c.lastrowid
+
+def update_job(job_id, title, description):
+    with get_connection() as conn:
+        c = conn.cursor()
+        c.execute("UPDATE job_description SET title = ?, description = ? WHERE id = ?",
+                  (title.strip() or _job_title(description), description, job_id))
+        _bump_data_version(c)
+
+def delete_job(job_id):
+    """Delete a job and its analyses"""
+    with get_connection() as conn:
+        c = conn.cursor()
+        c.execute("DELETE FROM cv_analysis WHERE job_id = ?", (job_id,))
+        c.execute("DELETE FROM job_stats WHERE job_id = ?", (job_id,))
+        c.execute("DELETE FROM job_description WHERE id = ?", (job_id,))
+        c.execute('''
+            UPDATE cvs SET analyzed = 0
+            WHERE analyzed = 1 AND NOT EXISTS (SELECT 1 FROM cv_analysis WHERE cv_name = cvs.name)
+        ''')
+        _bump_data_version(c)
+
+def get_or_create_job(title, description):
+    """Id of the job titled `title`, with its description updated if it changed, created if there is none.
+
+    A job without that title but with exactly this description (saved by an
+    older version, titled after its first line) is adopted and renamed.
+    Editing the description keeps the job, so only its analyses become stale.
+    """
+    with get_connection() as conn:
+        c = conn.cursor()
+        c.execute("SELECT id, title, description FROM job_description WHERE title = ? ORDER BY id LIMIT 1", (title,))
+        result = c.fetchone()
+        if result is None:
+            c.execute("SELECT id, title, description FROM job_description WHERE description = ? ORDER BY id LIMIT 1",
+                      (description,))
+            result = c.fetchone()
+    if result is None:
+        return create_job(title, description)
+    job_id, saved_title, saved_description = result
+    if (saved_title, saved_description) != (title, description):
+        update_job(job_id, title, description)
+    return job_id
+
+@cached_read
+def get_jobs():
+    """All jobs as (id, title, description), oldest first"""
+    with get_connection() as conn:
+        c = conn.cursor()
+        c.execute("SELECT id, title, description FROM job_description ORDER BY id")
+        return c.fetchall()
+
+@cached_read
+def get_job_coverage():
+    """(job_id, title, analyzed, stale, total) per job: how many registered CVs have an analysis for it"""
+    with get_connection() as conn:
+        c = conn.cursor()
+        c.execute('''
+            SELECT j.id, j.title, COALESCE(s.total, 0),
+                   (SELECT COUNT(*) FROM cv_analysis a WHERE a.job_id = j.id AND a.stale = 1),
+                   (SELECT COUNT(*) FROM cvs)
+            FROM job_description j LEFT JOIN job_stats s ON s.job_id = j.id
+            ORDER BY j.id
+        ''')
+        return c.fetchall()
+
+@cached_read
+def get_job_stamps():
+    """Stamp recorded for each job's current description and prompt, by job id"""
+    with get_connection() as conn:
+        c = conn.cursor()
+        c.execute("SELECT id, stamp FROM job_description")
+        return dict(c.fetchall())
+
+def update_job_stamps(stamps):
+    """Record new current stamps by job id and flag the analyses made with other stamps as stale"""
+    with get_connection() as conn:
+        c = conn.cursor()
+        for job_id, stamp in stamps.items():
+            c.execute("UPDATE job_description SET stamp = ? WHERE id = ?", (stamp, job_id))
+            c.execute("UPDATE cv_analysis SET stale = (analysis_stamp IS NOT ?) WHERE job_id = ?", (stamp, job_id))
+        _bump_data_version(c)
+
+@cached_read
+def get_stale_analyses(job_ids=None):
+    """Analyses whose job description or prompt changed, as (cv_name, cv_path, job_id), highest score first"""
+    conditions = ["a.stale = 1"]
+    params = []
+    if job_ids is not None:
+        conditions.append("a.job_id IN (SELECT value FROM json_each(?))")
+        params.append(json.dumps(list(job_ids)))
+    with get_connection() as conn:
+        c = conn.cursor()
+        c.execute(f'''
+            SELECT a.cv_name, cvs.path, a.job_id FROM cv_analysis a JOIN cvs ON cvs.name = a.cv_name
+            WHERE {" AND ".join(conditions)}
+            ORDER BY a.score_fit DESC, a.cv_name, a.job_id
+        ''', params)
+        return c.fetchall()
 
-def add_cv(name, path):
-    conn = create_connection()
-    c = conn.cursor()
-    c.execute("SELECT 1 FROM cvs WHERE name = ?", (name,))
-    exists = c.fetchone()
-    if not exists:
-        c.execute("INSERT INTO cvs (name, path) VALUES (?, ?)", (name, path))
-    conn.commit()
-    conn.close()
+@cached_read
+def get_missing_analyses(job_ids=None):
+    """Empty cells of the CV × job matrix as (cv_name, cv_path, job_id), for all jobs or the given ones"""
+    conditions = ["NOT EXISTS (SELECT 1 FROM cv_analysis a WHERE a.cv_name = cvs.name AND a.job_id = j.id)"]
+    params = []
+    if job_ids is not None:
+        conditions.append("j.id IN (SELECT value FROM json_each(?))")
+        params.append(json.dumps(list(job_ids)))
+    with get_connection() as conn:
+        c = conn.cursor()
+        c.execute(f'''
+            SELECT cvs.name, cvs.path, j.id FROM job_description j CROSS JOIN cvs
+            WHERE {" AND ".join(conditions)}
+            ORDER BY cvs.name, j.id
+        ''', params)
+        return c.fetchall()
 
+def get_cv_by_hash(content_hash):
+    """Get (name, path, analyzed) of a registered CV with this content, preferring analyzed ones"""
+    with get_connection() as conn:
+        c = conn.cursor()
+        c.execute("SELECT name, path, analyzed FROM cvs WHERE content_hash = ? ORDER BY analyzed DESC, id LIMIT 1",
+                  (content_hash,))
+        return c.fetchone()
+
+def is_path_shared(path, name):
+    """Whether a CV other than `name` uses this file (a linked duplicate)"""
+    with get_connection() as conn:
+        c = conn.cursor()
+        c.execute("SELECT 1 FROM cvs WHERE path = ? AND name != ? LIMIT 1", (path, name))
+        return c.fetchone() is not None
+
+def get_cvs_by_hashes(content_hashes):
+    """Map each already registered content hash to the (name, path) of its CV, preferring analyzed CVs"""
+    with get_connection() as conn:
+        c = conn.cursor()
+        # Later rows overwrite earlier ones in the dict, so the preferred CV comes last
+        c.execute('''
+            SELECT content_hash, name, path FROM cvs
+            WHERE content_hash IN (SELECT value FROM json_each(?))
+            ORDER BY analyzed, id DESC
+        ''', (json.dumps(list(content_hashes)),))
+        return {content_hash: (name, path) for content_hash, name, path in c.fetchall()}
+
+def get_cvs_by_names(names):
+    """Map each already registered name in `names` to the (content_hash, path) of its CV"""
+    with get_connection() as conn:
+        c = conn.cursor()
+        c.execute("SELECT name, content_hash, path FROM cvs WHERE name IN (SELECT value FROM json_each(?))",
+                  (json.dumps(list(names)),))
+        return {name: (content_hash, path) for name, content_hash, path in c.fetchall()}
+
+def register_cv(name, path, content_hash):
+    """Register a CV by content. A known name with new content is queued for re-analysis"""
+    register_cvs([(name, path, content_hash)])
+
+def register_cvs(cvs):
+    """Register many (name, path, content_hash) CVs in one transaction.
+
+    CVs registered before content hashes were stored (NULL hash) adopt the
+    hash and keep their analyses instead of being queued again.
+    """
+    with get_connection() as conn:
+        c = conn.cursor()
+        changes = conn.total_changes
+        c.executemany('''
+            INSERT INTO cvs (name, path, content_hash) VALUES (?, ?, ?)
+            ON CONFLICT (name) DO UPDATE SET
+                path = excluded.path,
+                content_hash = excluded.content_hash,
+                analyzed = CASE WHEN content_hash IS NULL THEN analyzed ELSE 0 END
+            WHERE content_hash IS NOT excluded.content_hash
+        ''', cvs)
+        if conn.total_changes != changes:
+            _bump_data_version(c)
+
+def link_duplicate_cv(name, existing_name):
+    """Register `name` as another copy of `existing_name`, reusing its file and analyses"""
+    with get_connection() as conn:
+        c = conn.cursor()
+        c.execute('''
+            INSERT INTO cvs (name, path, analyzed, full_name, email, content_hash)
+            SELECT ?, path, analyzed, full_name, email, content_hash FROM cvs WHERE name = ?
+            ON CONFLICT (name) DO UPDATE SET
+                path = excluded.path,
+                analyzed = excluded.analyzed,
+                full_name = excluded.full_name,
+                email = excluded.email,
+                content_hash = excluded.content_hash
+        ''', (name, existing_name))
+
+        # Same content, same analyses: copy every job's analysis and its items
+        columns = [column.strip() for column in _ANALYSIS_COLUMNS.split(",")][1:] + ["analysis_stamp"]
+        c.execute("DELETE FROM cv_analysis WHERE cv_name = ? AND job_id NOT IN (SELECT job_id FROM cv_analysis WHERE cv_name = ?)",
+                  (name, existing_name))
+        c.execute(f'''
+            INSERT INTO cv_analysis (cv_name, {", ".join(columns)})
+            SELECT ?, {", ".join(columns)} FROM cv_analysis WHERE cv_name = ?
+            ON CONFLICT (cv_name, job_id) DO UPDATE SET {", ".join(f"{column} = excluded.{column}" for column in columns)}
+        ''', (name, existing_name))
+        c.execute("DELETE FROM analysis_item WHERE analysis_id IN (SELECT id FROM cv_analysis WHERE cv_name = ?)", (name,))
+        c.execute('''
+            INSERT INTO analysis_item (analysis_id, kind, value, normalized)
+            SELECT copy.id, i.kind, i.value, i.normalized
+            FROM cv_analysis source
+            JOIN cv_analysis copy ON copy.job_id = source.job_id AND copy.cv_name = ?
+            JOIN analysis_item i ON i.analysis_id = source.id
+            WHERE source.cv_name = ?
+        ''', (name, existing_name))
+        _bump_data_version(c)
+
+@cached_read
 def get_all_cvs():
-    conn = create_connection()
-    c = conn.cursor()
-    c.execute("SELECT name, analyzed, full_name, email FROM cvs")
-    cvs = c.fetchall()
-    conn.close()
+    with get_connection() as conn:
+        c = conn.cursor()
+        c.execute("SELECT name, analyzed, full_name, email FROM cvs")
+        cvs = c.fetchall()
     return cvs
 
+# CV list sort options: label -> ORDER BY clause
+CV_SORT_OPTIONS = {
+    "File name": "name",
+    "Not analyzed first": "analyzed, name",
+    "Analyzed first": "analyzed DESC, name",
+    "Candidate name": "full_name IS NULL, full_name COLLATE NOCASE, name"
+}
+
+@cached_read
+def query_cvs(sort="File name", limit=50, offset=0):
+    """Get one page of registered CVs as (name, analyzed, full_name, email) rows"""
+    order_by = CV_SORT_OPTIONS.get(sort, CV_SORT_OPTIONS["File name"])
+    with get_connection() as conn:
+        c = conn.cursor()
+        c.execute(f"SELECT name, analyzed, full_name, email FROM cvs ORDER BY {order_by} LIMIT ? OFFSET ?",
+                  (limit, offset))
+        return c.fetchall()
+
+@cached_read
+def count_cvs():
+    with get_connection() as conn:
+        c = conn.cursor()
+        c.execute("SELECT COUNT(*) FROM cvs")
+        return c.fetchone()[0]
+
 def clear_database():
-    conn = create_connection()
-    c = conn.cursor()
-    c.execute("DELETE FROM cvs")
-    c.execute("DELETE FROM cv_analysis")
-    conn.commit()
-    conn.close()
+    with get_connection() as conn:
+        c = conn.cursor()
+        c.execute("DELETE FROM cvs")
+        c.execute("DELETE FROM cv_analysis")
+        _bump_data_version(c)
+
+def get_cached_cv_text(path, size, mtime):
+    """Get stored text for a file whose size and mtime have not changed"""
+    with get_connection() as conn:
+        c = conn.cursor()
+        c.execute('''
+            SELECT t.text FROM cv_file_stat f
+            JOIN cv_text t ON t.content_hash = f.content_hash
+            WHERE f.path = ? AND f.size = ? AND f.mtime = ?
+        ''', (path, size, mtime))
+        result = c.fetchone()
+    return result[0] if result else None
+
+def get_cv_text_by_hash(content_hash):
+    """Get stored text for a given file content hash"""
+    with get_connection() as conn:
+        c = conn.cursor()
+        c.execute("SELECT text FROM cv_text WHERE content_hash = ?", (content_hash,))
+        result = c.fetchone()
+    return result[0] if result else None
+
+def get_registered_cv_text(path):
+    """Stored text of the content registered for a CV file, found without reading the file"""
+    with get_connection() as conn:
+        c = conn.cursor()
+        c.execute('''
+            SELECT t.text FROM cvs JOIN cv_text t ON t.content_hash = cvs.content_hash
+            WHERE cvs.path = ? LIMIT 1
+        ''', (path,))
+        result = c.fetchone()
+    return result[0] if result else None
+
+def save_cv_text(path, size, mtime, content_hash, text, page_count=None):
+    """Store extracted text and remember the file's size/mtime"""
+    with get_connection() as conn:
+        c = conn.cursor()
+        c.execute("INSERT OR IGNORE INTO cv_text (content_hash, text, page_count) VALUES (?, ?, ?)",
+                  (content_hash, text, page_count))
+        c.execute("INSERT OR REPLACE INTO cv_file_stat (path, size, mtime, content_hash) VALUES (?, ?, ?, ?)",
+                  (path, size, mtime, content_hash))
+        _bump_data_version(c)
+
+# --- Similarity matrix rows ---
+# Only read by similarity.py, never through cached_read, so these writes don't bump the data version
+
+def get_cv_vector_sources(cv_names):
+    """Stored text and matched skills (across jobs) of CVs, as {cv_name: (text, skills)}"""
+    with get_connection() as conn:
+        c = conn.cursor()
+        c.execute('''
+            SELECT cvs.name, t.text FROM cvs
+            LEFT JOIN cv_file_stat f ON f.path = cvs.path
+            LEFT JOIN cv_text t ON t.content_hash = f.content_hash
+            WHERE cvs.name IN (SELECT value FROM json_each(?))
+        ''', (json.dumps(list(cv_names)),))
+        sources = {name: (text or "", []) for name, text in c.fetchall()}
+        c.execute('''
+            SELECT DISTINCT a.cv_name, i.normalized FROM cv_analysis a
+            JOIN analysis_item i ON i.analysis_id = a.id AND i.kind = 'skill'
+            WHERE a.cv_name IN (SELECT value FROM json_each(?))
+            ORDER BY a.cv_name, i.normalized
+        ''', (json.dumps(list(sources)),))
+        for name, skill in c.fetchall():
+            sources[name][1].append(skill)
+    return sources
+
+def get_cv_vector_rows(cv_names):
+    """Matrix row and vector key of indexed CVs, as {cv_name: (row, vector_key)}"""
+    with get_connection() as conn:
+        c = conn.cursor()
+        c.execute("SELECT cv_name, row, vector_key FROM cv_vector WHERE cv_name IN (SELECT value FROM json_each(?))",
+                  (json.dumps(list(cv_names)),))
+        return {name: (row, vector_key) for name, row, vector_key in c.fetchall()}
+
+def get_unindexed_cvs():
+    """Names of registered CVs without a row in the similarity matrix"""
+    with get_connection() as conn:
+        c = conn.cursor()
+        c.execute("SELECT name FROM cvs WHERE name NOT IN (SELECT cv_name FROM cv_vector) ORDER BY name")
+        return [row[0] for row in c.fetchall()]
+
+def allocate_cv_vector_rows(cv_names):
+    """Give each CV a matrix row, appending new ones after the last row; returns {cv_name: row}"""
+    with get_connection() as conn:
+        c = conn.cursor()
+        # Serialize allocation between processes
+        c.execute("BEGIN IMMEDIATE")
+        c.execute("SELECT COALESCE(MAX(row), -1) FROM cv_vector")
+        next_row = c.fetchone()[0] + 1
+        c.execute("SELECT cv_name, row FROM cv_vector WHERE cv_name IN (SELECT value FROM json_each(?))",
+                  (json.dumps(list(cv_names)),))
+        rows = dict(c.fetchall())
+        new_rows = []
+        for name in cv_names:
+            if name not in rows:
+                rows[name] = next_row
+                new_rows.append((name, next_row))
+                next_row += 1
+        c.executemany("INSERT INTO cv_vector (cv_name, row) VALUES (?, ?)", new_rows)
+    return rows
+
+def update_cv_vector_keys(keys):
+    """Record the inputs each CV's vector was computed from, as {cv_name: vector_key}"""
+    with get_connection() as conn:
+        c = conn.cursor()
+        c.executemany("UPDATE cv_vector SET vector_key = ? WHERE cv_name = ?",
+                      [(key, name) for name, key in keys.items()])
 
+def get_cv_names_by_rows(rows):
+    """CV names of matrix rows, as {row: cv_name}; rows of deleted CVs are missing"""
+    with get_connection() as conn:
+        c = conn.cursor()
+        c.execute("SELECT row, cv_name FROM cv_vector WHERE row IN (SELECT value FROM json_each(?))",
+                  (json.dumps(list(rows)),))
+        return dict(c.fetchall())
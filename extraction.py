@@ -0,0 +1,131 @@
+import hashlib
+import multiprocessing
+import os
+import signal
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from PyPDF2 import PdfReader
+from database import get_cached_cv_text, get_cv_text_by_hash, get_registered_cv_text, save_cv_text
+from compaction import PAGE_BREAK
+
+try:
+    import resource
+except ImportError:  # Windows: no per-process memory limits
+    resource = None
+
+EXTRACTION_WORKERS = int(os.getenv("EXTRACTION_WORKERS", str(os.cpu_count() or 1)))
+# Per-file limits so one pathological PDF cannot stall or OOM the batch
+EXTRACTION_TIMEOUT = float(os.getenv("EXTRACTION_TIMEOUT", "60"))
+EXTRACTION_MAX_MEMORY_MB = int(os.getenv("EXTRACTION_MAX_MEMORY_MB", "1024"))
+
+def file_sha256(path, chunk_size=1024 * 1024):
+    """SHA-256 of a file, read in chunks"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def extract_pdf_text(cv_path):
+    """Extract the text of every page of a PDF, returns (text, page_count)
+
+    Pages are separated by form feeds so compaction can spot repeated headers and footers.
+    """
+    reader = PdfReader(cv_path)
+    pages = [page.extract_text() or "" for page in reader.pages]
+    return PAGE_BREAK.join(pages), len(pages)
+
+def _lookup_stored_text(cv_path):
+    """Returns (text or None, stat, content_hash) for a file"""
+    try:
+        stat = os.stat(cv_path)
+    except FileNotFoundError:
+        # The PDF was removed, but the text of the content registered for it was already extracted
+        cv_text = get_registered_cv_text(cv_path)
+        if cv_text is None:
+            raise
+        return cv_text, None, None
+    cv_text = get_cached_cv_text(cv_path, stat.st_size, stat.st_mtime)
+    if cv_text is not None:
+        return cv_text, stat, None
+
+    content_hash = file_sha256(cv_path)
+    return get_cv_text_by_hash(content_hash), stat, content_hash
+
+def _init_extraction_worker(max_memory_mb):
+    if resource is not None and max_memory_mb:
+        limit = max_memory_mb * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+
+def _on_timeout(signum, frame):
+    raise TimeoutError("PDF extraction timed out")
+
+def _extract_with_timeout(cv_path, timeout):
+    if timeout and hasattr(signal, "setitimer"):
+        signal.signal(signal.SIGALRM, _on_timeout)
+        signal.setitimer(signal.ITIMER_REAL, timeout)
+    try:
+        return extract_pdf_text(cv_path)
+    finally:
+        if timeout and hasattr(signal, "setitimer"):
+            signal.setitimer(signal.ITIMER_REAL, 0)
+
+def extract_pdf_texts(cv_paths, max_workers=EXTRACTION_WORKERS, timeout=EXTRACTION_TIMEOUT,
+                      max_memory_mb=EXTRACTION_MAX_MEMORY_MB):
+    """Extract PDFs on a process pool.
+
+    Yields (cv_path, text, page_count, error) in completion order. A file that
+    exceeds `timeout` seconds or `max_memory_mb` fails on its own without
+    affecting the rest of the batch.
+    """
+    cv_paths = list(cv_paths)
+    if not cv_paths:
+        return
+
+    with ProcessPoolExecutor(max_workers=max(1, min(max_workers, len(cv_paths))),
+                             mp_context=multiprocessing.get_context("spawn"),
+                             initializer=_init_extraction_worker,
+                             initargs=(max_memory_mb,)) as executor:
+        futures = {executor.submit(_extract_with_timeout, cv_path, timeout): cv_path for cv_path in cv_paths}
+        try:
+            for future in as_completed(futures):
+                cv_path = futures[future]
+                try:
+                    cv_text, page_count = future.result()
+                    yield cv_path, cv_text, page_count, None
+                except Exception as e:
+                    yield cv_path, None, None, e
+        except GeneratorExit:
+            # Closed early by the caller: don't wait for files not started yet
+            executor.shutdown(wait=False, cancel_futures=True)
+            raise
+
+def extract_texts(cv_paths, max_workers=EXTRACTION_WORKERS, timeout=EXTRACTION_TIMEOUT,
+                  max_memory_mb=EXTRACTION_MAX_MEMORY_MB):
+    """Get the text of many CVs, extracting new content in parallel.
+
+    Yields (cv_path, text, error) as each file is ready: stored texts first,
+    then freshly extracted ones, which are saved to the database as they arrive.
+    """
+    pending = {}
+    for cv_path in cv_paths:
+        try:
+            cv_text, stat, content_hash = _lookup_stored_text(cv_path)
+        except OSError as e:
+            yield cv_path, None, e
+            continue
+
+        if cv_text is None:
+            pending[cv_path] = (stat, content_hash)
+            continue
+        if content_hash is not None:
+            # Same content already extracted under another path
+            save_cv_text(cv_path, stat.st_size, stat.st_mtime, content_hash, cv_text)
+        yield cv_path, cv_text, None
+
+    for cv_path, cv_text, page_count, error in extract_pdf_texts(pending, max_workers, timeout, max_memory_mb):
+        if error:
+            yield cv_path, None, error
+            continue
+        stat, content_hash = pending[cv_path]
+        save_cv_text(cv_path, stat.st_size, stat.st_mtime, content_hash, cv_text, page_count)
+        yield cv_path, cv_text, None
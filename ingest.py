@@ -0,0 +1,182 @@
+import hashlib
+import os
+import tempfile
+import zipfile
+from collections import Counter
+from database import (get_cv_by_hash, get_cvs_by_hashes, get_cvs_by_names, is_path_shared,
+                      register_cv, register_cvs, link_duplicate_cv)
+
+CV_DIR = "CV"
+CHUNK_SIZE = 1024 * 1024
+# ZIP members declaring a larger uncompressed size are skipped (zip bombs, scanned books)
+MAX_MEMBER_MB = int(os.getenv("INGEST_MAX_MEMBER_MB", "50"))
+
+def _hash_stream(stream):
+    """SHA-256 of a file-like object, read in chunks and rewound afterwards"""
+    digest = hashlib.sha256()
+    stream.seek(0)
+    for chunk in iter(lambda: stream.read(CHUNK_SIZE), b""):
+        digest.update(chunk)
+    stream.seek(0)
+    return digest.hexdigest()
+
+def _write_stream(stream, path):
+    """Copy a file-like object to disk in chunks, replacing the target atomically"""
+    tmp_path = path + ".part"
+    stream.seek(0)
+    with open(tmp_path, "wb") as f:
+        for chunk in iter(lambda: stream.read(CHUNK_SIZE), b""):
+            f.write(chunk)
+    os.replace(tmp_path, path)
+
+def _copy_hashing(stream, f):
+    """Copy a stream into an open file in chunks, returns the SHA-256 of the content"""
+    digest = hashlib.sha256()
+    for chunk in iter(lambda: stream.read(CHUNK_SIZE), b""):
+        digest.update(chunk)
+        f.write(chunk)
+    return digest.hexdigest()
+
+def _storage_path(cv_dir, name, content_hash):
+    """Where to store new content for `name` without breaking linked duplicates"""
+    path = os.path.join(cv_dir, name)
+    if is_path_shared(path, name):
+        # The old content is still used by a linked duplicate, keep it and store the new one apart
+        stem, ext = os.path.splitext(name)
+        path = os.path.join(cv_dir, f"{stem}-{content_hash[:8]}{ext}")
+    return path
+
+def ingest_upload(uploaded_file, cv_dir=CV_DIR):
+    """Register an uploaded PDF by content hash.
+
+    Returns (status, cv_name) where status is:
+    - "unchanged": same name and content already registered, nothing written
+    - "duplicate": same content under another name; linked to the existing CV and its analysis
+    - "new" / "updated": content written to disk and queued for analysis
+    """
+    name = os.path.basename(uploaded_file.name)
+    content_hash = _hash_stream(uploaded_file)
+
+    existing = get_cv_by_hash(content_hash)
+    if existing:
+        existing_name = existing[0]
+        if existing_name == name:
+            return "unchanged", name
+        link_duplicate_cv(name, existing_name)
+        return "duplicate", existing_name
+
+    os.makedirs(cv_dir, exist_ok=True)
+    registered = get_cvs_by_names({name})
+    if name in registered and registered[name][0] is None:
+        status = "unchanged" # Registered before content hashes: adopts this one and keeps its analyses
+    else:
+        status = "updated" if os.path.exists(os.path.join(cv_dir, name)) else "new"
+    path = _storage_path(cv_dir, name, content_hash)
+    _write_stream(uploaded_file, path)
+    register_cv(name, path, content_hash)
+    return status, name
+
+def _register_batch(staged, cv_dir=None):
+    """Register staged (name, content_hash, path, tmp_path) files with one query per step.
+
+    Files with `tmp_path` are moved into `cv_dir` only when their content is new.
+    Returns a list of (status, cv_name, path) with the statuses of ingest_upload,
+    where path is the file each CV ends up registered with.
+    """
+    known = get_cvs_by_hashes({content_hash for _, content_hash, _, _ in staged})
+    registered = get_cvs_by_names({name for name, _, _, _ in staged})
+    results, new_cvs, duplicates = [], [], []
+    batch_names, batch_paths = {}, set()
+    for name, content_hash, path, tmp_path in staged:
+        if batch_names.get(name, content_hash) != content_hash:
+            # Same name with other content earlier in this batch: a different person, keep both
+            stem, ext = os.path.splitext(name)
+            name = f"{stem}-{content_hash[:8]}{ext}"
+            registered.update(get_cvs_by_names({name}))
+        batch_names.setdefault(name, content_hash)
+        if content_hash in known:
+            existing_name, existing_path = known[content_hash]
+            if tmp_path:
+                os.remove(tmp_path)
+            if registered.get(name, (None,))[0] == content_hash:
+                results.append(("unchanged", name, registered[name][1]))
+            else:
+                duplicates.append((name, existing_name))
+                results.append(("duplicate", name, existing_path))
+            continue
+
+        if tmp_path:
+            path = _storage_path(cv_dir, name, content_hash)
+            if path in batch_paths:
+                stem, ext = os.path.splitext(path)
+                path = f"{stem}-{content_hash[:8]}{ext}"
+            os.replace(tmp_path, path)
+            batch_paths.add(path)
+        # Later copies of the same content in this batch link to this one
+        known[content_hash] = (name, path)
+        if name not in registered:
+            status = "new"
+        elif registered[name][0] is None:
+            status = "unchanged" # Registered before content hashes: adopts this one and keeps its analyses
+        else:
+            status = "updated"
+        registered[name] = (content_hash, path)
+        new_cvs.append((name, path, content_hash))
+        results.append((status, name, path))
+
+    register_cvs(new_cvs)
+    for name, existing_name in duplicates:
+        link_duplicate_cv(name, existing_name)
+    return results
+
+def _is_pdf_member(member):
+    name = os.path.basename(member.filename)
+    return (not member.is_dir() and name.lower().endswith(".pdf")
+            and not name.startswith(".") and not member.filename.startswith("__MACOSX/"))
+
+def _member_names(members):
+    """CV name of each ZIP member: its file name, prefixed with its folders when other members share it"""
+    counts = Counter(os.path.basename(member.filename) for member in members)
+    return [os.path.basename(member.filename) if counts[os.path.basename(member.filename)] == 1
+            else member.filename.strip("/").replace("/", "_") for member in members]
+
+def ingest_zip(source, cv_dir=CV_DIR):
+    """Register every PDF in a ZIP archive (a path or a file-like object).
+
+    Members are decompressed straight to `cv_dir` one chunk at a time while
+    hashing, so the archive is never held in memory. Files with the same name
+    in different folders (juan/CV.pdf, maria/CV.pdf) become separate CVs named
+    after their folders. Returns (status, cv_name, path) per PDF; "skipped"
+    marks members over INGEST_MAX_MEMBER_MB.
+    """
+    os.makedirs(cv_dir, exist_ok=True)
+    staged, skipped = [], []
+    try:
+        with zipfile.ZipFile(source) as archive:
+            members = list(filter(_is_pdf_member, archive.infolist()))
+            for member, name in zip(members, _member_names(members)):
+                if member.file_size > MAX_MEMBER_MB * 1024 * 1024:
+                    skipped.append(("skipped", name, None))
+                    continue
+                fd, tmp_path = tempfile.mkstemp(suffix=".part", dir=cv_dir)
+                staged.append((name, None, None, tmp_path))
+                with archive.open(member) as stream, os.fdopen(fd, "wb") as f:
+                    staged[-1] = (name, _copy_hashing(stream, f), None, tmp_path)
+    except BaseException:
+        # Corrupt archive or interrupted copy: leave no partial files behind
+        for _, _, _, tmp_path in staged:
+            os.remove(tmp_path)
+        raise
+    return _register_batch(staged, cv_dir) + skipped
+
+def ingest_folder(folder):
+    """Register every PDF in a server-side folder in place, without copying.
+
+    Returns (status, cv_name, path) per PDF like ingest_zip.
+    """
+    staged = []
+    for entry in sorted(os.scandir(folder), key=lambda entry: entry.name):
+        if entry.is_file() and entry.name.lower().endswith(".pdf"):
+            with open(entry.path, "rb") as f:
+                staged.append((entry.name, _hash_stream(f), entry.path, None))
+    return _register_batch(staged)
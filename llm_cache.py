@@ -0,0 +1,96 @@
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+
+# Persistent cache of raw model responses, kept apart from cv_database.db so that
+# "Clear Database" does not throw away responses we already paid for
+CACHE_PATH = os.getenv("LLM_CACHE_PATH", "llm_cache.db")
+MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "5000"))
+MAX_AGE_DAYS = float(os.getenv("LLM_CACHE_MAX_AGE_DAYS", "30"))
+
+_stats_lock = threading.Lock()
+_stats = {"hits": 0, "misses": 0}
+
+def _create_connection():
+    conn = sqlite3.connect(CACHE_PATH, timeout=30)
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS llm_cache (
+            key TEXT PRIMARY KEY,
+            response TEXT NOT NULL,
+            created_at REAL NOT NULL,
+            last_access REAL NOT NULL,
+            hit_count INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_llm_cache_last_access ON llm_cache (last_access)")
+    return conn
+
+def normalize_text(text):
+    """Collapse whitespace so cosmetic extraction differences share a cache entry"""
+    return re.sub(r"\s+", " ", text or "").strip()
+
+def make_cache_key(cv_text, job_description, model_name, prompt_version):
+    """Hash of everything that determines the model response"""
+    digest = hashlib.sha256()
+    for part in (normalize_text(cv_text), normalize_text(job_description), model_name, str(prompt_version)):
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+def get_cached_response(key):
+    """Return the cached raw response for key, or None on a miss"""
+    now = time.time()
+    conn = _create_connection()
+    c = conn.cursor()
+    c.execute("SELECT response FROM llm_cache WHERE key = ? AND created_at >= ?",
+              (key, now - MAX_AGE_DAYS * 86400))
+    result = c.fetchone()
+    if result:
+        c.execute("UPDATE llm_cache SET last_access = ?, hit_count = hit_count + 1 WHERE key = ?", (now, key))
+        conn.commit()
+    conn.close()
+
+    with _stats_lock:
+        _stats["hits" if result else "misses"] += 1
+    return result[0] if result else None
+
+def put_cached_response(key, response):
+    """Store a raw response and evict expired / least recently used entries"""
+    now = time.time()
+    conn = _create_connection()
+    c = conn.cursor()
+    c.execute('''
+        INSERT OR REPLACE INTO llm_cache (key, response, created_at, last_access, hit_count)
+        VALUES (?, ?, ?, ?, 0)
+    ''', (key, response, now, now))
+    c.execute("DELETE FROM llm_cache WHERE created_at < ?", (now - MAX_AGE_DAYS * 86400,))
+    c.execute('''
+        DELETE FROM llm_cache WHERE key IN (
+            SELECT key FROM llm_cache ORDER BY last_access DESC LIMIT -1 OFFSET ?
+        )
+    ''', (MAX_ENTRIES,))
+    conn.commit()
+    conn.close()
+
+def get_cache_stats():
+    """Hit/miss counters for this process plus persisted entry/hit totals"""
+    conn = _create_connection()
+    c = conn.cursor()
+    c.execute("SELECT COUNT(*), COALESCE(SUM(hit_count), 0) FROM llm_cache")
+    entries, total_hits = c.fetchone()
+    conn.close()
+
+    with _stats_lock:
+        stats = dict(_stats)
+    stats["entries"] = entries
+    stats["total_hits"] = total_hits
+    return stats
+
+def clear_cache():
+    conn = _create_connection()
+    conn.execute("DELETE FROM llm_cache")
+    conn.commit()
+    conn.close()
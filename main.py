@@ -1,9 +1,14 @@
 
-import streamlit as st
 import os
-from database import create_table, add_cv, get_all_cvs, clear_database, update_cv_analysis, save_job_description, get_job_description, get_unanalyzed_cvs, save_analysis_result
-from analyzer import analyze_cv, get_api_key
-from PyPDF2 import PdfReader
+import zipfile
+import streamlit as st
+import pandas as pd
+from database import create_table, count_cvs, query_cvs, CV_SORT_OPTIONS, clear_database, get_jobs, create_job, update_job, delete_job, get_job_coverage, get_missing_analyses, get_stale_analyses
+from analyzer import get_api_key, get_usage_stats
+from pipeline import run_analysis, AnalysisWriter, DEFAULT_WORKERS, DEFAULT_BATCH_SIZE, job_stamps, mark_stale_analyses, prioritize
+from llm_cache import get_cache_stats
+from ingest import ingest_upload, ingest_zip, ingest_folder
+from extraction import extract_texts
 from utils import parse_json_result, navigate_to_page
 
 # --- App Setup ---
@@ -44,6 +49,11 @@ def check_environment():
 # Verificar configuración al inicio
 api_key = check_environment()
 
+# Apply pending schema migrations (no-op after the first run in this process)
+create_table()
+# Flag analyses of edited jobs, or made with an older prompt, as stale
+mark_stale_analyses()
+
 # Initialize session state
 if "current_page" not in st.session_state:
     st.session_state.current_page = "main"
@@ -63,81 +73,235 @@ elif st.session_state.current_page == "all_analyses":
 
 # --- Main Page ---
 st.title("📄 CV Analyzer")
-create_table()
 
-# --- Job Description Input ---
-st.header("Job Description")
-job_description = st.text_area("Enter the job description here:", value=get_job_description(), height=200)
-if st.button("Save Job Description"):
-    save_job_description(job_description)
-    st.success("Job description saved!")
+# --- Jobs ---
+st.header("Jobs")
+jobs = get_jobs()
+job_labels = {job_id: f"{title} (#{job_id})" for job_id, title, _ in jobs}
+job_options = {label: job_id for job_id, label in job_labels.items()}
+job_descriptions = {job_id: description for job_id, _, description in jobs}
+NEW_JOB = "➕ New job"
+
+# A job saved in the previous run becomes the selected one (the widget can't be set after it is drawn)
+if "saved_job" in st.session_state:
+    st.session_state.selected_job = job_labels[st.session_state.pop("saved_job")]
+selected_job = st.selectbox("Job:", list(job_options) + [NEW_JOB], key="selected_job")
+job_id = job_options.get(selected_job)
+saved_title = next((title for id_, title, _ in jobs if id_ == job_id), "")
+# Keyed by job so switching jobs shows that job's saved values
+job_title = st.text_input("Title:", value=saved_title, key=f"job_title_{job_id}")
+job_description = st.text_area("Job description:", value=job_descriptions.get(job_id, ""), height=200,
+                               key=f"job_description_{job_id}")
+
+col1, col2 = st.columns([1, 1])
+with col1:
+    if st.button("Save Job"):
+        if not job_description.strip():
+            st.warning("Please enter a job description.")
+        else:
+            if job_id:
+                update_job(job_id, job_title, job_description)
+            else:
+                job_id = create_job(job_title, job_description)
+                # Start the next new job from empty fields
+                st.session_state.pop("job_title_None", None)
+                st.session_state.pop("job_description_None", None)
+            st.session_state.saved_job = job_id
+            st.rerun()
+with col2:
+    if job_id and st.button("Delete Job"):
+        delete_job(job_id)
+        st.session_state.pop("selected_job", None)
+        st.rerun()
+if job_id and job_description != job_descriptions[job_id]:
+    st.caption("Unsaved changes: analyses use the saved job description.")
 
 # --- File Uploader ---
 st.header("Upload CVs")
 uploaded_files = st.file_uploader("Choose PDF files", type="pdf", accept_multiple_files=True)
 
 if uploaded_files:
-    cv_dir = "CV"
-    if not os.path.exists(cv_dir):
-        os.makedirs(cv_dir)
+    # Files stay in the uploader across reruns; only ingest each upload once per session
+    ingested_uploads = st.session_state.setdefault("ingested_uploads", set())
+    new_uploads = [f for f in uploaded_files if f.file_id not in ingested_uploads]
+
+    if new_uploads:
+        statuses = {}
+        for uploaded_file in new_uploads:
+            status, cv_name = ingest_upload(uploaded_file)
+            statuses.setdefault(status, []).append(uploaded_file.name)
+            ingested_uploads.add(uploaded_file.file_id)
+
+        if statuses.get("new") or statuses.get("updated"):
+            st.success(f"Files uploaded successfully! ({len(statuses.get('new', []))} new, {len(statuses.get('updated', []))} updated)")
+        if statuses.get("duplicate"):
+            st.info("Same content as an already registered CV, reusing its analysis: " + ", ".join(statuses["duplicate"]))
+        if statuses.get("unchanged"):
+            st.info("Already uploaded: " + ", ".join(statuses["unchanged"]))
 
-    for uploaded_file in uploaded_files:
-        file_path = os.path.join(cv_dir, uploaded_file.name)
-        with open(file_path, "wb") as f:
-            f.write(uploaded_file.getbuffer())
-        add_cv(uploaded_file.name, file_path)
+# --- Bulk Import ---
+def extract_ingested(results):
+    """Extract the text of newly ingested CVs in parallel so analysis starts from stored text"""
+    paths = [path for status, _, path in results if status in ("new", "updated")]
+    if not paths:
+        return
+    progress_bar = st.progress(0, text=f"Extracting text from {len(paths)} CVs...")
+    failed = []
+    for i, (path, _, error) in enumerate(extract_texts(paths), 1):
+        if error:
+            failed.append(os.path.basename(path))
+        progress_bar.progress(i / len(paths), text=f"Extracting text from {len(paths)} CVs... ({i}/{len(paths)})")
+    if failed:
+        st.warning("Could not extract text from: " + ", ".join(failed))
+
+def report_ingested(results):
+    counts = {}
+    for status, _, _ in results:
+        counts[status] = counts.get(status, 0) + 1
+    st.success(f"Imported {len(results)} PDFs: " + ", ".join(f"{count} {status}" for status, count in counts.items()))
+
+with st.expander("Bulk import (ZIP archive or server folder)"):
+    zip_file = st.file_uploader("ZIP archive with PDF CVs", type="zip")
+    if zip_file and zip_file.file_id not in st.session_state.setdefault("ingested_uploads", set()):
+        try:
+            results = ingest_zip(zip_file)
+        except zipfile.BadZipFile as e:
+            st.error(f"Invalid ZIP archive: {e}")
+        else:
+            st.session_state.ingested_uploads.add(zip_file.file_id)
+            report_ingested(results)
+            extract_ingested(results)
 
-    st.success("Files uploaded successfully!")
-    st.rerun()
+    source_path = st.text_input("Or a folder / ZIP path on the server:")
+    if st.button("Import from server") and source_path:
+        if os.path.isdir(source_path):
+            results = ingest_folder(source_path)
+        elif zipfile.is_zipfile(source_path):
+            results = ingest_zip(source_path)
+        else:
+            results = None
+            st.error(f"{source_path} is not a folder or a ZIP archive.")
+        if results is not None:
+            report_ingested(results)
+            extract_ingested(results)
 
 # --- Analysis Button ---
-st.header("Analyze CVs")
-if st.button("Analyze Unanalyzed CVs"):
-    if not job_description:
-        st.warning("Please enter a job description before analyzing CVs.")
-    else:
-        unanalyzed_cvs = get_unanalyzed_cvs()
-        if unanalyzed_cvs:
-            st.info(f"Analyzing {len(unanalyzed_cvs)} unanalyzed CVs...")
-            progress_bar = st.progress(0)
-            successful_analyses = 0
+def run_analysis_batch(cells):
+    """Analyze (cv_name, cv_path, job_id) cells with a progress bar and save the results.
+
+    The report is kept in the session so it is still shown after the rerun that refreshes the page.
+    """
+    progress_bar = st.progress(0)
+    successful_analyses = 0
+    errors = []
+    # (original, compacted) token estimates per file, filled by the pipeline's feeder thread
+    compaction = {}
+    
+    with AnalysisWriter(job_stamps(job_descriptions)) as writer:
+        analyses = run_analysis(cells, job_descriptions, int(max_workers), batch_size=int(batch_size),
+                                on_compacted=lambda cv_path, *tokens: compaction.__setitem__(cv_path, tokens))
+        for i, (cv_name, analysis_job_id, analysis_result, error) in enumerate(analyses):
+            try:
+                if error:
+                    raise error
+
+                # Parse JSON result using utility function
+                analysis_data = parse_json_result(analysis_result)
             
-            for i, (cv_name, cv_path) in enumerate(unanalyzed_cvs):
-                try:
-                    # Extract text from PDF
-                    reader = PdfReader(cv_path)
-                    cv_text = ""
-                    for page in reader.pages:
-                        cv_text += page.extract_text() + "\n"
-
-                    # Analyze CV using Gemini API
-                    analysis_result = analyze_cv(cv_text, job_description)
-
-                    # Parse JSON result using utility function
-                    analysis_data = parse_json_result(analysis_result)
-                    
-                    if analysis_data:
-                        # Extract name and email for basic CV table
-                        full_name = analysis_data.get("nombre_candidato", "N/A")
-                        email = analysis_data.get("email", "N/A")
-                        
-                        # Save complete analysis to database
-                        save_analysis_result(cv_name, analysis_data)
-                        
-                        # Update basic CV info
-                        update_cv_analysis(cv_name, full_name, email)
-                        
-                        successful_analyses += 1
-                        
-                except Exception as e:
-                    st.error(f"Error analyzing {cv_name}: {e}")
-                    
-                progress_bar.progress((i + 1) / len(unanalyzed_cvs))
+                if analysis_data:
+                    # Queue complete analysis and CV status for the next group commit
+                    writer.add(cv_name, analysis_job_id, analysis_data)
+                    successful_analyses += 1
+                
+            except Exception as e:
+                errors.append(f"Error analyzing {cv_name}: {e}")
+                st.error(f"Error analyzing {cv_name}: {e}")
             
-            st.success(f"Analysis complete! Successfully analyzed {successful_analyses} out of {len(unanalyzed_cvs)} CVs.")
+            progress_bar.progress((i + 1) / len(cells))
+    # Analyses the database rejected when their group was saved
+    for cv_name, _, e in writer.failed:
+        successful_analyses -= 1
+        errors.append(f"Error saving the analysis of {cv_name}: {e}")
+
+    st.session_state.analysis_report = {"successful": successful_analyses, "total": len(cells),
+                                        "compaction": compaction, "errors": errors}
+
+def show_analysis_report(report):
+    """Summary of the last analysis run: successes, tokens saved by compaction and failed CVs"""
+    st.success(f"Analysis complete! {report['successful']} of {report['total']} analyses succeeded.")
+    compaction = report["compaction"]
+    if compaction:
+        original_tokens = sum(tokens[0] for tokens in compaction.values())
+        compacted_tokens = sum(tokens[1] for tokens in compaction.values())
+        st.caption(f"CV compaction: {original_tokens} → {compacted_tokens} tokens across {len(compaction)} CVs")
+        with st.expander("Tokens saved per CV"):
+            st.dataframe(pd.DataFrame([(os.path.basename(cv_path), original, compacted, original - compacted)
+                                       for cv_path, (original, compacted) in sorted(compaction.items())],
+                                      columns=["CV", "Original tokens", "Compacted tokens", "Saved"]), hide_index=True)
+    if report["errors"]:
+        with st.expander(f"⚠️ {len(report['errors'])} analyses failed"):
+            for message in report["errors"]:
+                st.write(message)
+
+st.header("Analyze CVs")
+if "analysis_report" in st.session_state:
+    show_analysis_report(st.session_state.analysis_report)
+coverage = get_job_coverage()
+if coverage:
+    st.dataframe(pd.DataFrame([(title, f"{analyzed}/{total}", stale) for _, title, analyzed, stale, total in coverage],
+                              columns=["Job", "CVs analyzed", "Stale"]), hide_index=True)
+jobs_to_analyze = st.multiselect("Jobs to analyze:", list(job_options), default=[selected_job] if job_id else [],
+                                 help="Each CV is analyzed once per selected job; existing analyses are kept")
+selected_job_ids = tuple(job_options[label] for label in jobs_to_analyze)
+max_workers = st.number_input("Parallel workers:", min_value=1, max_value=32, value=DEFAULT_WORKERS,
+                              help="Number of CVs analyzed at the same time")
+batch_size = st.number_input("CVs per request:", min_value=1, max_value=20, value=DEFAULT_BATCH_SIZE,
+                             help="Send several CVs of the same job in one request, so the job description and instructions are sent once per batch")
+col1, col2 = st.columns([1, 1])
+with col1:
+    min_relevance = st.slider("Minimum relevance:", min_value=0.0, max_value=1.0, value=0.0, step=0.05,
+                              help="Skip CVs whose keyword match with the job is below this fraction of the best CV's")
+with col2:
+    top_k = st.number_input("Analyze only the top K CVs per job (0 = all):", min_value=0, value=0)
+cache_stats = get_cache_stats()
+st.caption(f"LLM cache: {cache_stats['entries']} entries · {cache_stats['hits']} hits / {cache_stats['misses']} misses this session · {cache_stats['total_hits']} hits total")
+usage = get_usage_stats()
+if usage["requests"]:
+    st.caption(f"Gemini: {usage['requests']} requests · {usage['prompt_tokens']} input tokens ({usage['cached_tokens']} cached) · {usage['output_tokens']} output tokens"
+               f" · {usage['throttled']} throttled, {usage['retries']} retries · concurrency {usage['concurrency']}")
+
+col1, col2 = st.columns([1, 1])
+with col1:
+    analyze_missing = st.button("Analyze Missing CV × Job Pairs")
+with col2:
+    reanalyze_stale = st.button("Re-analyze Stale Analyses",
+                                help="Only analyses made with an older version of the job description or prompt, best scores first")
+if (analyze_missing or reanalyze_stale) and not selected_job_ids:
+    st.warning("Please save a job and select it before analyzing CVs.")
+elif analyze_missing:
+    missing_analyses = get_missing_analyses(selected_job_ids)
+    if missing_analyses:
+        # Most relevant CVs first, so the best candidates show up before the batch ends
+        with st.spinner("Ranking CVs by relevance..."):
+            ranked_analyses, _ = prioritize(missing_analyses, job_descriptions, min_relevance, int(top_k) or None)
+        skipped = len(missing_analyses) - len(ranked_analyses)
+        if ranked_analyses:
+            st.info(f"Running {len(ranked_analyses)} analyses ({len({name for name, _, _ in ranked_analyses})} CVs × {len(selected_job_ids)} jobs)"
+                    + (f", skipping {skipped} below the relevance cutoff" if skipped else "") + "...")
+            run_analysis_batch(ranked_analyses)
             st.rerun()
         else:
-            st.info("No unanalyzed CVs found.")
+            st.info(f"None of the {skipped} pending analyses reach the relevance cutoff.")
+    else:
+        st.info("Every CV has already been analyzed for the selected jobs.")
+elif reanalyze_stale:
+    stale_analyses = get_stale_analyses(selected_job_ids)
+    if stale_analyses:
+        st.info(f"Re-analyzing {len(stale_analyses)} stale analyses...")
+        run_analysis_batch(stale_analyses)
+        st.rerun()
+    else:
+        st.info("No stale analyses for the selected jobs.")
 
 # --- Display CVs ---
 st.header("List of CVs")
@@ -152,36 +316,41 @@ with col2:
         st.success("Database cleared!")
         st.rerun()
 
-cv_list = get_all_cvs()
+total_cvs = count_cvs()
 
-# Display the list of CVs as a table with action buttons
-if cv_list:
+# Display one page of CVs as a selectable table; selecting an analyzed CV opens its analysis
+if total_cvs:
     st.subheader("CV List")
     
-    for name, analyzed, full_name, email in cv_list:
-        col1, col2, col3, col4, col5 = st.columns([3, 2, 2, 2, 2])
-        
-        with col1:
-            st.write(f"**{name}**")
-        
-        with col2:
-            st.write("✅ Analyzed" if analyzed else "❌ Not Analyzed")
-        
-        with col3:
-            st.write(full_name if full_name else "N/A")
-        
-        with col4:
-            st.write(email if email else "N/A")
-        
-        with col5:
-            if analyzed:
-                if st.button(f"View Analysis", key=f"view_{name}"):
-                    st.session_state.selected_cv = name
-                    navigate_to_page("cv_details")
-            else:
-                st.write("Not available")
-        
-        st.divider()
+    col1, col2, col3 = st.columns([2, 1, 1])
+    with col1:
+        cv_sort = st.selectbox("Sort by:", list(CV_SORT_OPTIONS), index=0)
+    with col2:
+        cv_page_size = st.selectbox("CVs per page:", [25, 50, 100, 200], index=1)
+    cv_page_count = max(1, -(-total_cvs // cv_page_size))
+    with col3:
+        cv_page = st.number_input(f"Page (of {cv_page_count}):", min_value=1, max_value=cv_page_count, value=1)
+    
+    cv_list = query_cvs(cv_sort, cv_page_size, (cv_page - 1) * cv_page_size)
+    cv_table = pd.DataFrame(
+        [(name, "✅ Analyzed" if analyzed else "❌ Not Analyzed", full_name or "N/A", email or "N/A")
+         for name, analyzed, full_name, email in cv_list],
+        columns=["CV", "Status", "Candidate", "Email"]
+    )
+    event = st.dataframe(cv_table, hide_index=True, use_container_width=True,
+                         on_select="rerun", selection_mode="single-row", key="cv_table")
+    st.caption(f"{total_cvs} CVs · select a row to view its analysis")
+    
+    if event.selection.rows:
+        name, analyzed, _, _ = cv_list[event.selection.rows[0]]
+        if analyzed:
+            # Drop the selection so coming back doesn't reopen the same analysis
+            st.session_state.pop("cv_table", None)
+            st.session_state.selected_cv = name
+            st.session_state.selected_job_id = job_id
+            navigate_to_page("cv_details")
+        else:
+            st.info(f"{name} has not been analyzed yet.")
 else:
     st.write("No CVs found in the database.")
 
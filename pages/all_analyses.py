@@ -1,15 +1,21 @@
 import streamlit as st
-from database import get_all_analysis_results
+import pandas as pd
+from database import query_analysis_results, count_analysis_results, get_analysis_filter_options, get_item_counts, get_analysis_summary, get_jobs, SCORE_RANGES, SORT_OPTIONS
 from utils import display_analysis_summary, handle_no_data_message, back_to_main, navigate_to_page, get_score_color, get_score_level
 
 def show_all_analyses():
     """Function to show all CV analyses page"""
     st.title("📊 All CV Analyses")
 
-    # --- Get all analysis results ---
-    analysis_results = get_all_analysis_results()
+    # --- Job selection: one column of the CV × job matrix, or all of it ---
+    job_titles = {job_id: title for job_id, title, _ in get_jobs()}
+    job_options = {"All jobs": None, **{f"{title} (#{job_id})": job_id for job_id, title in job_titles.items()}}
+    job_id = job_options[st.selectbox("Job:", list(job_options), index=len(job_options) - 1)]
 
-    if not analysis_results:
+    # --- Summary of all analysis results ---
+    summary = get_analysis_summary(job_id)
+
+    if not summary["total"]:
         handle_no_data_message("No analysis results found. Please analyze some CVs first.")
         return
 
@@ -17,10 +23,10 @@ def show_all_analyses():
     st.subheader("🔍 Filters")
 
     col1, col2, col3, col4 = st.columns(4)
+    all_names, all_positions = get_analysis_filter_options()
 
     with col1:
         # Filter by candidate name
-        all_names = list(set([result["nombre_candidato"] for result in analysis_results if result["nombre_candidato"] != "N/A"]))
         selected_name = st.selectbox(
             "Filter by Candidate Name:",
             ["All"] + all_names,
@@ -29,7 +35,6 @@ def show_all_analyses():
 
     with col2:
         # Filter by position
-        all_positions = list(set([result["puesto_solicitado"] for result in analysis_results if result["puesto_solicitado"] != "N/A"]))
         selected_position = st.selectbox(
             "Filter by Position:",
             ["All"] + all_positions,
@@ -40,55 +45,76 @@ def show_all_analyses():
         # Filter by score range
         score_range = st.selectbox(
             "Filter by Score:",
-            ["All Scores", "8.0-10.0 (Excellent)", "6.0-7.9 (Good)", "4.0-5.9 (Moderate)", "0.0-3.9 (Low)"],
+            ["All Scores"] + list(SCORE_RANGES),
             index=0
         )
 
     with col4:
         # Search functionality
-        search_term = st.text_input("Search in analysis content:", placeholder="Enter keywords...")
-
-    # --- Apply filters ---
-    filtered_results = analysis_results
-
-    if selected_name != "All":
-        filtered_results = [r for r in filtered_results if r["nombre_candidato"] == selected_name]
-
-    if selected_position != "All":
-        filtered_results = [r for r in filtered_results if r["puesto_solicitado"] == selected_position]
-
-    if score_range != "All Scores":
-        if score_range == "8.0-10.0 (Excellent)":
-            filtered_results = [r for r in filtered_results if r.get("score_fit", 0.0) >= 8.0]
-        elif score_range == "6.0-7.9 (Good)":
-            filtered_results = [r for r in filtered_results if 6.0 <= r.get("score_fit", 0.0) < 8.0]
-        elif score_range == "4.0-5.9 (Moderate)":
-            filtered_results = [r for r in filtered_results if 4.0 <= r.get("score_fit", 0.0) < 6.0]
-        elif score_range == "0.0-3.9 (Low)":
-            filtered_results = [r for r in filtered_results if r.get("score_fit", 0.0) < 4.0]
-
-    if search_term:
-        search_term_lower = search_term.lower()
-        filtered_results = [r for r in filtered_results if 
-                           search_term_lower in r["nombre_candidato"].lower() or
-                           search_term_lower in r["resumen_idoneidad"].lower() or
-                           any(search_term_lower in skill.lower() for skill in r["habilidades_coincidentes"]) or
-                           any(search_term_lower in exp.lower() for exp in r["experiencia_coincidente"])]
+        search_term = st.text_input("Search in analysis content:", placeholder="Enter keywords...",
+                                    help="Matches names, summaries, skills, experience and CV text; accents and word endings are ignored")
+
+    col1, col2, col3, col4 = st.columns(4)
+    with col1:
+        # Filter by skill, with the number of candidates that have it
+        skill_counts = get_item_counts("skill", limit=50, job_id=job_id)
+        skill_options = {f"{value} ({count})": value for value, count in skill_counts}
+        selected_skill = st.selectbox("Filter by Skill:", ["All"] + list(skill_options), index=0)
+    with col2:
+        # Rank by relevance while searching
+        sort_by = st.selectbox("Sort by:", list(SORT_OPTIONS),
+                               index=list(SORT_OPTIONS).index("Relevance") if search_term.strip() else 0)
+    with col3:
+        page_size = st.selectbox("Results per page:", [10, 20, 50, 100], index=1)
+
+    # --- Apply filters (in the database) ---
+    filters = dict(
+        name=None if selected_name == "All" else selected_name,
+        position=None if selected_position == "All" else selected_position,
+        score_range=None if score_range == "All Scores" else score_range,
+        search=search_term.strip() or None,
+        skill=skill_options.get(selected_skill),
+        job_id=job_id
+    )
+    total_found = count_analysis_results(**filters)
+    page_count = max(1, -(-total_found // page_size))
+    with col4:
+        page = st.number_input(f"Page (of {page_count}):", min_value=1, max_value=page_count, value=1)
+
+    filtered_results = query_analysis_results(**filters, sort=sort_by, limit=page_size, offset=(page - 1) * page_size)
 
     # --- Display results ---
-    st.subheader(f"📋 Analysis Results ({len(filtered_results)} found)")
+    st.subheader(f"📋 Analysis Results ({total_found} found)")
 
     if filtered_results:
-        # Sort by score (highest first)
-        filtered_results.sort(key=lambda x: x.get("score_fit", 0.0), reverse=True)
-        
-        # Create expandable sections for each analysis
-        for i, result in enumerate(filtered_results):
+        # One compact row per result; full detail is only built for the opened row
+        opened_analysis = st.session_state.get("opened_analysis")
+        for result in filtered_results:
             score = result.get("score_fit", 0.0)
             color = get_score_color(score)
             level = get_score_level(score)
+            # A CV appears once per job when showing all jobs
+            row_key = (result["cv_name"], result["job_id"])
+            row_id = f"{result['cv_name']}_{result['job_id']}"
+            is_open = row_key == opened_analysis
             
-            with st.expander(f"{color} {result['cv_name']} - {result['nombre_candidato']} (Score: {score:.1f}/10.0)", expanded=False):
+            col1, col2 = st.columns([6, 1])
+            with col1:
+                job_title = f" · {job_titles.get(result['job_id'], 'N/A')}" if job_id is None else ""
+                stale = " · ⚠️ stale" if result["stale"] else ""
+                st.markdown(f"{color} **{result['cv_name']}** - {result['nombre_candidato']} "
+                            f"(Score: {score:.1f}/10.0 · {result.get('recomendacion', 'N/A')}{job_title}{stale})")
+                if result.get("snippet"):
+                    st.caption(f"🔎 {result['snippet']}")
+            with col2:
+                if st.button("Hide" if is_open else "Details", key=f"toggle_{row_id}"):
+                    st.session_state.opened_analysis = None if is_open else row_key
+                    st.rerun()
+            
+            if not is_open:
+                continue
+            
+            with st.container(border=True):
                 # Quick score overview
                 col1, col2, col3 = st.columns(3)
                 with col1:
@@ -104,12 +130,13 @@ def show_all_analyses():
                 # Action buttons
                 col1, col2 = st.columns(2)
                 with col1:
-                    if st.button(f"View Full Analysis", key=f"view_full_{i}"):
+                    if st.button(f"View Full Analysis", key=f"view_full_{row_id}"):
                         st.session_state.selected_cv = result["cv_name"]
+                        st.session_state.selected_job_id = result["job_id"]
                         navigate_to_page("cv_details")
                 
                 with col2:
-                    if st.button(f"Download Analysis", key=f"download_{i}"):
+                    if st.button(f"Download Analysis", key=f"download_{row_id}"):
                         # TODO: Implement download functionality
                         st.info("Download functionality coming soon!")
 
@@ -120,38 +147,32 @@ def show_all_analyses():
     st.divider()
     st.subheader("📈 Summary Statistics")
 
-    if analysis_results:
-        col1, col2, col3, col4 = st.columns(4)
-        
-        with col1:
-            total_analyses = len(analysis_results)
-            st.metric("Total Analyses", total_analyses)
-        
-        with col2:
-            unique_candidates = len(set([r["nombre_candidato"] for r in analysis_results if r["nombre_candidato"] != "N/A"]))
-            st.metric("Unique Candidates", unique_candidates)
-        
-        with col3:
-            avg_score = sum(r.get("score_fit", 0.0) for r in analysis_results) / len(analysis_results)
-            st.metric("Avg Fit Score", f"{avg_score:.1f}/10.0")
-        
-        with col4:
-            high_scores = len([r for r in analysis_results if r.get("score_fit", 0.0) >= 7.0])
-            st.metric("High Scores (≥7.0)", high_scores)
-        
-        # Score distribution
-        st.subheader("📊 Score Distribution")
-        score_ranges = {
-            "8.0-10.0 (Excellent)": len([r for r in analysis_results if r.get("score_fit", 0.0) >= 8.0]),
-            "6.0-7.9 (Good)": len([r for r in analysis_results if 6.0 <= r.get("score_fit", 0.0) < 8.0]),
-            "4.0-5.9 (Moderate)": len([r for r in analysis_results if 4.0 <= r.get("score_fit", 0.0) < 6.0]),
-            "0.0-3.9 (Low)": len([r for r in analysis_results if r.get("score_fit", 0.0) < 4.0])
-        }
-        
-        col1, col2, col3, col4 = st.columns(4)
-        for i, (range_name, count) in enumerate(score_ranges.items()):
-            with [col1, col2, col3, col4][i]:
-                st.metric(range_name, count)
+    col1, col2, col3, col4 = st.columns(4)
+    
+    with col1:
+        st.metric("Total Analyses", summary["total"])
+    
+    with col2:
+        st.metric("Unique Candidates", summary["unique_candidates"])
+    
+    with col3:
+        st.metric("Avg Fit Score", f"{summary['avg_score']:.1f}/10.0")
+    
+    with col4:
+        st.metric("High Scores (≥7.0)", summary["high_scores"])
+    
+    # Score distribution
+    st.subheader("📊 Score Distribution")
+    col1, col2, col3, col4 = st.columns(4)
+    for i, (range_name, count) in enumerate(summary["score_distribution"].items()):
+        with [col1, col2, col3, col4][i]:
+            st.metric(range_name, count)
+
+    # Most common matching skills across all candidates
+    top_skills = get_item_counts("skill", limit=20, job_id=job_id)
+    if top_skills:
+        st.subheader("🏷️ Top Matching Skills")
+        st.bar_chart(pd.DataFrame(top_skills, columns=["Skill", "Candidates"]).set_index("Skill"), horizontal=True)
 
     # --- Navigation ---
     st.divider()
@@ -1,7 +1,33 @@
 import streamlit as st
-from database import get_analysis_result, get_all_cvs
+from database import get_analysis_result, get_all_cvs, get_cv_analysis_jobs
+from similarity import find_similar_cvs, index_unindexed_cvs
 from utils import display_analysis_metrics, display_analysis_details, show_navigation_buttons, handle_no_data_message, back_to_main, get_score_color, get_score_level
 
+def show_similar_candidates(cv_name, k=10):
+    """Panel with the CVs closest to this one by text and matched skills"""
+    st.subheader("🔍 Similar candidates")
+    with st.spinner("Indexing CVs..."):
+        # CVs registered or analyzed before the similarity index existed
+        index_unindexed_cvs()
+    similar = find_similar_cvs(cv_name, k)
+    if not similar:
+        st.info("No similar candidates found yet.")
+        return
+
+    cvs = {name: (analyzed, full_name) for name, analyzed, full_name, _ in get_all_cvs()}
+    for similar_cv, similarity in similar:
+        analyzed, full_name = cvs.get(similar_cv, (False, None))
+        col1, col2, col3 = st.columns([4, 1, 1])
+        with col1:
+            st.write(f"**{full_name}** ({similar_cv})" if full_name and full_name != "N/A" else f"**{similar_cv}**")
+        with col2:
+            st.write(f"{similarity:.0%} similar")
+        with col3:
+            if st.button("View", key=f"similar_{similar_cv}", disabled=not analyzed,
+                         help=None if analyzed else "Not analyzed yet"):
+                st.session_state.selected_cv = similar_cv
+                st.rerun()
+
 def show_cv_details():
     """Function to show CV analysis details page"""
     st.title("📊 CV Analysis Details")
@@ -34,11 +60,24 @@ def show_cv_details():
 
     # --- Display Analysis ---
     if selected_cv:
-        analysis_result = get_analysis_result(selected_cv)
+        # One analysis per job; open the requested job's, or the best scoring one
+        cv_jobs = get_cv_analysis_jobs(selected_cv)
+        job_options = {f"{title} ({score or 0.0:.1f})": job_id for job_id, title, score in cv_jobs}
+        job_ids = list(job_options.values())
+        requested_job_id = st.session_state.get("selected_job_id")
+        job_id = None
+        if job_options:
+            selected_job = st.selectbox("Job:", list(job_options),
+                                        index=job_ids.index(requested_job_id) if requested_job_id in job_ids else 0)
+            job_id = job_options[selected_job]
+        analysis_result = get_analysis_result(selected_cv, job_id)
         
         if analysis_result:
             # Header with CV name
             st.subheader(f"📄 Analysis for: {selected_cv}")
+            if analysis_result["stale"]:
+                st.warning("⚠️ The job description or the analysis prompt changed after this analysis was made. "
+                           "Use \"Re-analyze Stale Analyses\" on the main page to refresh it.")
             
             # Display metrics using utility function
             display_analysis_metrics(analysis_result)
@@ -75,6 +114,9 @@ def show_cv_details():
             # Display detailed analysis using utility function
             display_analysis_details(analysis_result)
             
+            st.divider()
+            show_similar_candidates(selected_cv)
+            
             # Navigation buttons using utility function
             st.divider()
             show_navigation_buttons()
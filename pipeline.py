@@ -0,0 +1,267 @@
+import functools
+import logging
+import os
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from extraction import extract_texts
+from compaction import compact_cv_text, CV_MAX_TOKENS
+from relevance import score_texts
+from similarity import index_cvs
+from database import save_analysis_batch, normalize_analysis, get_jobs, get_job_stamps, update_job_stamps
+
+logger = logging.getLogger(__name__)
+
+# Number of CVs analyzed in parallel (each worker holds one in-flight Gemini call)
+DEFAULT_WORKERS = int(os.getenv("ANALYSIS_WORKERS", "4"))
+# Group commit: completed analyses are written together once this many are pending
+# or the oldest has waited PERSIST_MAX_DELAY seconds
+PERSIST_BATCH_SIZE = int(os.getenv("PERSIST_BATCH_SIZE", "10"))
+PERSIST_MAX_DELAY = float(os.getenv("PERSIST_MAX_DELAY", "2"))
+
+# CVs sent to the model in a single request per job (1 disables batching)
+DEFAULT_BATCH_SIZE = int(os.getenv("ANALYSIS_BATCH_SIZE", "1"))
+
+def _analyze_text(cv_text, job_description, analyze_fn):
+    analysis_result = analyze_fn(cv_text, job_description)
+    if not analysis_result:
+        raise RuntimeError("Empty response from model")
+    return analysis_result
+
+def run_analysis(tasks, jobs, max_workers=DEFAULT_WORKERS, analyze_fn=None,
+                 batch_size=DEFAULT_BATCH_SIZE, analyze_batch_fn=None,
+                 max_cv_tokens=CV_MAX_TOKENS, on_compacted=None):
+    """Analyze (cv_name, cv_path, job_id) cells of the CV × job matrix concurrently.
+
+    `jobs` maps each job_id to its description. Text extraction runs on a
+    process pool in a background thread; each file's text is read once and
+    handed to the analysis thread pool for every job that needs it, as soon as
+    it is ready. CVs sharing a file (linked duplicates) are analyzed once per
+    job and the result is yielded for each of them. Yields
+    (cv_name, job_id, analysis_result, error) tuples in
+    completion order so the caller can persist each result and update progress
+    as soon as it is ready. `analyze_fn` defaults to `analyzer.analyze_cv` and
+    can be replaced by a fake model for benchmarks.
+
+    With `batch_size` > 1, texts are grouped per job and each group is sent
+    to `analyze_batch_fn` (default `analyzer.analyze_cvs`), which maps a
+    {file: text} dict to {file: analysis_result or exception}; the last partial group
+    of each job is sent when extraction finishes.
+
+    Each text is compacted to `max_cv_tokens` (see compaction.compact_cv_text)
+    before prompting; `on_compacted(cv_path, original_tokens, compacted_tokens)`
+    is called from the feeder thread for every compacted file.
+    """
+    if batch_size > 1:
+        if analyze_batch_fn is None:
+            from analyzer import analyze_cvs
+            analyze_batch_fn = analyze_cvs
+    elif analyze_fn is None:
+        from analyzer import analyze_cv
+        analyze_fn = analyze_cv
+
+    tasks = list(tasks)
+    # cv_path -> job_id -> names of the CVs stored in that file
+    cells_by_path = {}
+    for cv_name, cv_path, job_id in tasks:
+        cells_by_path.setdefault(cv_path, {}).setdefault(job_id, []).append(cv_name)
+    results = queue.Queue()
+
+    def put(cv_names, job_id, analysis_result, error):
+        for cv_name in cv_names:
+            results.put((cv_name, job_id, analysis_result, error))
+
+    def on_done(cv_names, job_id, future):
+        try:
+            put(cv_names, job_id, future.result(), None)
+        except Exception as e:
+            put(cv_names, job_id, None, e)
+
+    def on_batch_done(job_id, cv_paths, future):
+        try:
+            batch_results = future.result()
+        except Exception as e:
+            batch_results, error = {}, e
+        else:
+            error = RuntimeError("Missing from batch response")
+        for cv_path in cv_paths:
+            analysis_result = batch_results.get(cv_path)
+            cv_names = cells_by_path[cv_path][job_id]
+            if isinstance(analysis_result, Exception):
+                put(cv_names, job_id, None, analysis_result)
+            elif analysis_result:
+                put(cv_names, job_id, analysis_result, None)
+            else:
+                put(cv_names, job_id, None, error)
+
+    executor = ThreadPoolExecutor(max_workers=max(1, max_workers))
+    stopped = threading.Event()
+    batches = {}
+
+    def submit_batch(job_id):
+        batch = batches.pop(job_id)
+        future = executor.submit(analyze_batch_fn, batch, jobs[job_id])
+        future.add_done_callback(functools.partial(on_batch_done, job_id, list(batch)))
+
+    def feed():
+        remaining = set(cells_by_path)
+        try:
+            for cv_path, cv_text, error in extract_texts(cells_by_path):
+                if stopped.is_set():
+                    break
+                remaining.discard(cv_path)
+                if not error:
+                    try:
+                        cv_text, original_tokens, compacted_tokens = compact_cv_text(cv_text, max_cv_tokens)
+                        if on_compacted:
+                            on_compacted(cv_path, original_tokens, compacted_tokens)
+                    except Exception as e:
+                        error = e
+                for job_id, cv_names in cells_by_path[cv_path].items():
+                    if error:
+                        put(cv_names, job_id, None, error)
+                    elif batch_size > 1:
+                        batches.setdefault(job_id, {})[cv_path] = cv_text
+                        if len(batches[job_id]) >= batch_size:
+                            submit_batch(job_id)
+                    else:
+                        future = executor.submit(_analyze_text, cv_text, jobs[job_id], analyze_fn)
+                        future.add_done_callback(functools.partial(on_done, cv_names, job_id))
+        except Exception as e:
+            for cv_path in remaining:
+                for job_id, cv_names in cells_by_path[cv_path].items():
+                    put(cv_names, job_id, None, e)
+        try:
+            for job_id in list(batches):
+                submit_batch(job_id)
+        except RuntimeError:
+            pass # The consumer stopped and shut the executor down
+
+    feeder = threading.Thread(target=feed, daemon=True)
+    feeder.start()
+    try:
+        for _ in range(len(tasks)):
+            yield results.get()
+    finally:
+        # If the consumer stops early (Ctrl+C, Streamlit rerun) drop the queued calls
+        # instead of waiting for them; only the calls already running finish
+        stopped.set()
+        executor.shutdown(wait=False, cancel_futures=True)
+    feeder.join()
+
+def prioritize(tasks, jobs, min_relevance=0.0, top_k=None):
+    """Order (cv_name, cv_path, job_id) cells by lexical relevance of the CV to its job.
+
+    Texts are extracted (or read from the database) up front and each job's
+    CVs are scored in one BM25 pass (see relevance.score_texts), 1.0 being the
+    best CV for that job. Cells below `min_relevance` or past the `top_k` best
+    of their job are left out; CVs whose text cannot be read go last so
+    run_analysis reports their error. Returns (ordered_tasks, relevance) where
+    relevance maps (cv_name, job_id) to the score.
+    """
+    tasks = list(tasks)
+    texts = {cv_path: cv_text for cv_path, cv_text, error in extract_texts({cv_path for _, cv_path, _ in tasks})
+             if not error}
+
+    cells_by_job = {}
+    for cell in tasks:
+        cells_by_job.setdefault(cell[2], []).append(cell)
+    relevance = {}
+    ranked, unreadable = [], []
+    for job_id, cells in cells_by_job.items():
+        readable = [cell for cell in cells if cell[1] in texts]
+        unreadable += [cell for cell in cells if cell[1] not in texts]
+        scores = score_texts([texts[cv_path] for _, cv_path, _ in readable], jobs[job_id])
+        order = sorted(range(len(readable)), key=lambda i: -scores[i])
+        for rank, i in enumerate(order):
+            cv_name, _, _ = readable[i]
+            relevance[(cv_name, job_id)] = float(scores[i])
+            if scores[i] >= min_relevance and (not top_k or rank < top_k):
+                ranked.append(readable[i])
+    ranked.sort(key=lambda cell: -relevance[(cell[0], cell[2])])
+    return ranked + unreadable, relevance
+
+def job_stamps(jobs):
+    """Current analysis stamp of each job, from a job_id -> description mapping"""
+    from analyzer import analysis_stamp
+    return {job_id: analysis_stamp(description) for job_id, description in jobs.items()}
+
+def mark_stale_analyses():
+    """Flag analyses made with an older job description or prompt version as stale.
+
+    Only jobs whose stamp changed since the last call touch their analyses,
+    so calling this on every page load is cheap.
+    """
+    stamps = job_stamps({job_id: description for job_id, _, description in get_jobs()})
+    recorded = get_job_stamps()
+    changed = {job_id: stamp for job_id, stamp in stamps.items() if recorded.get(job_id) != stamp}
+    if changed:
+        update_job_stamps(changed)
+    return changed
+
+class AnalysisWriter:
+    """Buffers parsed analyses and saves them in one transaction per group.
+
+    `stamps` maps each job_id to the stamp of the description the analyses
+    were made with (see job_stamps). Use as a context manager so pending
+    results are flushed even if the batch is interrupted.
+
+    add() raises ValueError for a reply that is not an analysis object, so
+    only that CV fails. Analyses the database rejects are collected in
+    `failed` as (cv_name, job_id, error) instead of blocking later saves.
+    """
+
+    def __init__(self, stamps=None, batch_size=PERSIST_BATCH_SIZE, max_delay=PERSIST_MAX_DELAY):
+        self.stamps = stamps or {}
+        self.batch_size = max(1, batch_size)
+        self.max_delay = max_delay
+        self.pending = []
+        self.failed = []
+        # Flushes from the timer thread and the caller's thread take turns
+        self.lock = threading.RLock()
+        self.timer = None
+
+    def add(self, cv_name, job_id, analysis_data):
+        analysis_data = normalize_analysis(analysis_data)
+        with self.lock:
+            self.pending.append((cv_name, job_id, analysis_data, self.stamps.get(job_id)))
+            if len(self.pending) >= self.batch_size:
+                self.flush()
+            elif self.timer is None:
+                # Saved after max_delay even if no other analysis finishes meanwhile (slow calls)
+                self.timer = threading.Timer(self.max_delay, self.flush)
+                self.timer.daemon = True
+                self.timer.start()
+
+    def flush(self):
+        with self.lock:
+            if self.timer is not None:
+                self.timer.cancel()
+                self.timer = None
+            # Taken off the buffer first so a failed group is never written again by the next flush
+            pending, self.pending = self.pending, []
+            if pending:
+                self._save(pending)
+
+    def _save(self, pending):
+        try:
+            save_analysis_batch(pending)
+        except Exception:
+            # The group was rolled back: save row by row so only the rejected analyses are lost
+            for row in pending:
+                try:
+                    save_analysis_batch([row])
+                except Exception as e:
+                    self.failed.append((row[0], row[1], e))
+        # New matched skills change the CVs' similarity vectors. Best effort: the analyses are
+        # already saved, and a vector left out of date is recomputed the next time its CV is indexed
+        try:
+            index_cvs({cv_name for cv_name, _, _, _ in pending})
+        except Exception:
+            logger.exception("Could not update the similarity vectors")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.flush()
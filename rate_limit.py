@@ -0,0 +1,157 @@
+import os
+import threading
+import time
+from tenacity import Retrying, retry_if_exception, stop_after_attempt, wait_random_exponential
+
+# Gemini quota of the project (requests and input tokens per minute; 0 disables the limit)
+GEMINI_RPM = int(os.getenv("GEMINI_RPM", "1000"))
+GEMINI_TPM = int(os.getenv("GEMINI_TPM", "1000000"))
+# Upper bound for in-flight requests; halved on every 429 and grown back one at a time
+GEMINI_MAX_CONCURRENCY = int(os.getenv("GEMINI_MAX_CONCURRENCY", "16"))
+GEMINI_MAX_ATTEMPTS = int(os.getenv("GEMINI_MAX_ATTEMPTS", "6"))
+# Longest single backoff, in seconds
+GEMINI_MAX_BACKOFF = float(os.getenv("GEMINI_MAX_BACKOFF", "60"))
+
+# HTTP statuses worth retrying: throttling, server errors and timeouts
+RETRYABLE_STATUS = {408, 429, 500, 502, 503, 504}
+
+def _status(exc):
+    # google.api_core exceptions carry the HTTP status in `code`
+    code = getattr(exc, "code", None)
+    return code if isinstance(code, int) else None
+
+def is_throttled(exc):
+    return _status(exc) == 429
+
+def is_retryable(exc):
+    """Whether an error is transient: throttling, a server error or a dropped connection"""
+    return _status(exc) in RETRYABLE_STATUS or isinstance(exc, (ConnectionError, TimeoutError))
+
+class TokenBucket:
+    """Allows `per_minute` units per minute, refilled continuously, with bursts up to one minute's worth"""
+
+    def __init__(self, per_minute):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self, amount=1):
+        """Block until `amount` units are available and take them"""
+        if not self.capacity:
+            return
+        # A request larger than the whole bucket waits for a full bucket and leaves it in debt
+        needed = min(amount, self.capacity)
+        while True:
+            with self.lock:
+                self._refill()
+                if self.tokens >= needed:
+                    self.tokens -= amount
+                    return
+                wait = (needed - self.tokens) / self.rate
+            time.sleep(wait)
+
+    def adjust(self, amount):
+        """Give back (positive) or take (negative) units once the real cost of a request is known"""
+        if not self.capacity:
+            return
+        with self.lock:
+            self._refill()
+            self.tokens = min(self.capacity, self.tokens + amount)
+
+class AdaptiveConcurrency:
+    """Caps in-flight requests, halving the cap when throttled and adding one back after a run of successes"""
+
+    def __init__(self, max_limit, increase_after=10):
+        self.max_limit = max(1, max_limit)
+        self.limit = self.max_limit
+        self.increase_after = increase_after
+        self.in_flight = 0
+        self.successes = 0
+        # Bumped on every decrease, so requests started under a previous cap don't halve it again
+        self.epoch = 0
+        self.condition = threading.Condition()
+
+    def acquire(self):
+        """Wait for a free slot; returns the epoch to hand back to release()"""
+        with self.condition:
+            while self.in_flight >= self.limit:
+                self.condition.wait()
+            self.in_flight += 1
+            return self.epoch
+
+    def release(self, epoch, succeeded=True, throttled=False):
+        with self.condition:
+            self.in_flight -= 1
+            if throttled:
+                self.successes = 0
+                # Requests already in flight when the quota ran out also come back as 429: count them once
+                if epoch == self.epoch:
+                    self.limit = max(1, self.limit // 2)
+                    self.epoch += 1
+            elif succeeded:
+                self.successes += 1
+                if self.successes >= self.increase_after and self.limit < self.max_limit:
+                    self.limit += 1
+                    self.successes = 0
+            self.condition.notify_all()
+
+class RateLimitedClient:
+    """Runs model calls within the request and token quotas, retrying transient errors with jittered backoff"""
+
+    def __init__(self, rpm=GEMINI_RPM, tpm=GEMINI_TPM, max_concurrency=GEMINI_MAX_CONCURRENCY,
+                 max_attempts=GEMINI_MAX_ATTEMPTS, max_backoff=GEMINI_MAX_BACKOFF):
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.concurrency = AdaptiveConcurrency(max_concurrency)
+        self.max_attempts = max_attempts
+        self.max_backoff = max_backoff
+        self.stats = {"throttled": 0, "retries": 0}
+        self.stats_lock = threading.Lock()
+
+    def _count(self, key):
+        with self.stats_lock:
+            self.stats[key] += 1
+
+    def _attempt(self, fn, estimated_tokens):
+        epoch = self.concurrency.acquire()
+        succeeded = throttled = False
+        try:
+            self.requests.acquire()
+            self.tokens.acquire(estimated_tokens)
+            result, used_tokens = fn()
+            if used_tokens is not None:
+                self.tokens.adjust(estimated_tokens - used_tokens)
+            succeeded = True
+            return result
+        except Exception as e:
+            throttled = is_throttled(e)
+            if throttled:
+                self._count("throttled")
+            raise
+        finally:
+            self.concurrency.release(epoch, succeeded, throttled)
+
+    def call(self, fn, estimated_tokens=0):
+        """Call `fn() -> (result, used_tokens or None)` and return its result.
+
+        Transient errors are retried up to `max_attempts` times; any other
+        error, or the last transient one, is raised to the caller.
+        """
+        retrying = Retrying(retry=retry_if_exception(is_retryable),
+                            wait=wait_random_exponential(multiplier=1, max=self.max_backoff),
+                            stop=stop_after_attempt(self.max_attempts),
+                            before_sleep=lambda state: self._count("retries"),
+                            reraise=True)
+        return retrying(self._attempt, fn, estimated_tokens)
+
+    def get_stats(self):
+        """Throttled responses, retries and the current concurrency cap"""
+        with self.stats_lock:
+            return dict(self.stats, concurrency=self.concurrency.limit)
@@ -0,0 +1,57 @@
+import re
+import unicodedata
+import numpy as np
+
+# BM25 parameters: term frequency saturation and document length normalization
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+# Spanish and English function words, ignored when matching CVs to a job description
+STOPWORDS = frozenset("""
+a al algo algunas algunos ante antes como con contra cual cuando de del desde donde durante e el ella ellas
+ellos en entre era eran es esa esas ese eso esos esta estaba estado estan estar este esto estos fue fueron ha
+han hasta hay la las le les lo los mas me mi mis mucho muy nada ni no nos nosotros o otra otras otro otros para
+pero poco por porque que quien se ser si sin sobre son su sus tambien tanto te tiene tienen todo todos tu tus un
+una uno unos y ya yo
+about above after again all also am an and any are as at be because been before being below between both but by
+can could did do does doing down during each few for from further had has have having he her here hers him his
+how i if in into is it its itself just me more most my no nor not of off on once only or other our ours out over
+own same she should so some such than that the their theirs them then there these they this those through to too
+under until up very was we were what when where which while who whom why will with would you your yours
+""".split())
+
+_TOKEN = re.compile(r"[a-z0-9]+(?:[+#]+|\.[a-z0-9]+)*")
+
+def tokenize(text):
+    """Lowercase, accent-free terms of a text without stopwords or bare numbers"""
+    text = unicodedata.normalize("NFKD", (text or "").lower())
+    text = "".join(ch for ch in text if not unicodedata.combining(ch))
+    return [term for term in _TOKEN.findall(text)
+            if len(term) > 1 and term not in STOPWORDS and not term.isdigit()]
+
+def score_texts(texts, query, k1=BM25_K1, b=BM25_B):
+    """BM25 score of each text against `query`, scaled so the best match is 1.0.
+
+    Only the query's terms are counted, so the whole batch is scored as one
+    (texts × query terms) matrix. Returns a float array aligned with `texts`.
+    """
+    terms = sorted(set(tokenize(query)))
+    if not texts or not terms:
+        return np.zeros(len(texts))
+    index = {term: i for i, term in enumerate(terms)}
+
+    tf = np.zeros((len(texts), len(terms)))
+    doc_len = np.zeros(len(texts))
+    for row, text in enumerate(texts):
+        tokens = tokenize(text)
+        doc_len[row] = len(tokens)
+        ids = [index[token] for token in tokens if token in index]
+        if ids:
+            tf[row] = np.bincount(ids, minlength=len(terms))
+
+    df = np.count_nonzero(tf, axis=0)
+    idf = np.log1p((len(texts) - df + 0.5) / (df + 0.5))
+    norm = k1 * (1 - b + b * doc_len / max(doc_len.mean(), 1.0))
+    scores = (tf * (k1 + 1) / (tf + norm[:, None])) @ idf
+    best = scores.max()
+    return scores / best if best > 0 else scores
@@ -0,0 +1,134 @@
+import hashlib
+import os
+import threading
+import zlib
+from collections import Counter
+import numpy as np
+import database
+from database import (get_cv_vector_sources, get_cv_vector_rows, get_unindexed_cvs, allocate_cv_vector_rows,
+                      update_cv_vector_keys, get_cv_names_by_rows)
+from relevance import tokenize
+
+# Hashed feature dimensions: 100k CVs take 100k × dim × 4 bytes on disk
+SIMILARITY_DIM = int(os.getenv("SIMILARITY_DIM", "512"))
+# Matched skills count this much more than a word of the CV text
+SKILL_WEIGHT = 3.0
+# The matrix file grows by this many rows at a time
+GROWTH_ROWS = 4096
+# Increment when the features change so every vector is recomputed
+FEATURE_VERSION = 1
+
+_matrices = {}
+_matrices_lock = threading.Lock()
+
+def vectors_path():
+    """Matrix file next to the current database, one per dimension"""
+    return f"{os.path.splitext(database.DB_PATH)[0]}_vectors_{SIMILARITY_DIM}.f32"
+
+def _features(text, skills):
+    """Word unigrams and bigrams of the text (log-scaled counts) plus matched skills"""
+    terms = tokenize(text)
+    counts = Counter(terms)
+    counts.update(f"{a} {b}" for a, b in zip(terms, terms[1:]))
+    features = {feature: np.log1p(count) for feature, count in counts.items()}
+    for skill in skills:
+        for feature in ["skill:" + skill] + tokenize(skill):
+            features[feature] = features.get(feature, 0.0) + SKILL_WEIGHT
+    return features
+
+def embed(text, skills=(), dim=SIMILARITY_DIM):
+    """Unit-length hashed feature vector of a CV"""
+    features = _features(text, skills)
+    vector = np.zeros(dim, dtype=np.float32)
+    if not features:
+        return vector
+    hashes = np.array([zlib.crc32(feature.encode("utf-8")) for feature in features], dtype=np.uint64)
+    # The top bit picks the sign so colliding features tend to cancel out instead of adding up
+    signs = np.where(hashes >> 31, -1.0, 1.0)
+    np.add.at(vector, (hashes % dim).astype(np.intp), signs * np.fromiter(features.values(), dtype=np.float64))
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+def _vector_key(text, skills):
+    digest = hashlib.sha256()
+    for part in (text, "\n".join(skills), str(SIMILARITY_DIM), str(FEATURE_VERSION)):
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()[:16]
+
+def _open_matrix(min_rows=0):
+    """Memory-map the matrix file, growing it (zero-filled, in place) to hold `min_rows`"""
+    path = vectors_path()
+    row_bytes = SIMILARITY_DIM * np.dtype(np.float32).itemsize
+    with _matrices_lock:
+        size = os.path.getsize(path) if os.path.exists(path) else 0
+        if size < min_rows * row_bytes:
+            with open(path, "ab") as f:
+                f.truncate(-(-min_rows // GROWTH_ROWS) * GROWTH_ROWS * row_bytes)
+            size = os.path.getsize(path)
+        rows = size // row_bytes
+        if not rows:
+            return None
+        matrix = _matrices.get(path)
+        # Another process may have grown the file since it was mapped
+        if matrix is None or matrix.shape[0] != rows:
+            matrix = np.memmap(path, dtype=np.float32, mode="r+", shape=(rows, SIMILARITY_DIM))
+            _matrices[path] = matrix
+        return matrix
+
+def index_cvs(cv_names):
+    """Compute the vectors of CVs that are new or whose text or matched skills changed.
+
+    Returns the number of vectors written.
+    """
+    sources = get_cv_vector_sources(list(cv_names))
+    indexed = get_cv_vector_rows(list(sources))
+    keys = {name: _vector_key(text, skills) for name, (text, skills) in sources.items()}
+    changed = [name for name, key in keys.items() if indexed.get(name, (None, None))[1] != key]
+    if not changed:
+        return 0
+
+    rows = allocate_cv_vector_rows(changed)
+    matrix = _open_matrix(max(rows.values()) + 1)
+    for name in changed:
+        matrix[rows[name]] = embed(*sources[name])
+    matrix.flush()
+    # Keys last: if the process dies before this point, the vectors are simply recomputed
+    update_cv_vector_keys({name: keys[name] for name in changed})
+    return len(changed)
+
+def index_unindexed_cvs(chunk_size=1000):
+    """Index every registered CV that has no vector yet, in chunks; returns how many were indexed"""
+    names = get_unindexed_cvs()
+    for start in range(0, len(names), chunk_size):
+        index_cvs(names[start:start + chunk_size])
+    return len(names)
+
+def find_similar_cvs(cv_name, k=10):
+    """Top `k` CVs by cosine similarity to `cv_name`, as [(cv_name, similarity)]"""
+    index_cvs([cv_name])
+    row = get_cv_vector_rows([cv_name]).get(cv_name, (None,))[0]
+    matrix = _open_matrix()
+    if row is None or matrix is None:
+        return []
+
+    # Vectors are unit length, so the dot product is the cosine similarity
+    scores = matrix @ np.array(matrix[row])
+    scores[row] = -np.inf
+    # Look past the top k in case some rows belong to deleted CVs
+    candidates = min(len(scores), 2 * k + 10)
+    top = np.argpartition(-scores, candidates - 1)[:candidates]
+    top = top[np.argsort(-scores[top])]
+    names = get_cv_names_by_rows([int(r) for r in top])
+
+    similar = []
+    for r in top:
+        if scores[r] <= 0:
+            break
+        if int(r) not in names:
+            matrix[r] = 0.0 # Row of a deleted CV
+            continue
+        similar.append((names[int(r)], float(scores[r])))
+        if len(similar) == k:
+            break
+    return similar
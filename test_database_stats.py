@@ -0,0 +1,136 @@
+"""Trigger-maintained statistics (analysis_stats, job_stats) against aggregates over cv_analysis.
+
+Run with: python -m pytest -q test_database_stats.py
+"""
+
+import sqlite3
+import pytest
+import database
+
+# Schema and data of a database created before the versioned migrations
+BASELINE_SCHEMA = """
+    CREATE TABLE cvs (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT NOT NULL,
+        path TEXT NOT NULL,
+        analyzed BOOLEAN NOT NULL DEFAULT 0,
+        full_name TEXT,
+        email TEXT
+    );
+    CREATE TABLE job_description (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        description TEXT NOT NULL
+    );
+    CREATE TABLE cv_analysis (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        cv_name TEXT NOT NULL,
+        nombre_candidato TEXT,
+        email TEXT,
+        puesto_solicitado TEXT,
+        score_fit REAL,
+        nivel_experiencia TEXT,
+        tiempo_experiencia TEXT,
+        habilidades_coincidentes TEXT,
+        experiencia_coincidente TEXT,
+        puntos_de_mejora TEXT,
+        resumen_idoneidad TEXT,
+        recomendacion TEXT,
+        riesgos TEXT,
+        fortalezas TEXT,
+        analysis_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (cv_name) REFERENCES cvs (name)
+    );
+    INSERT INTO job_description (description) VALUES ('Backend developer\nPython, SQL');
+    INSERT INTO cvs (name, path, analyzed, full_name) VALUES
+        ('ana.pdf', 'CV/ana.pdf', 1, 'Ana'),
+        ('ben.pdf', 'CV/ben.pdf', 1, 'Ben'),
+        ('eva.pdf', 'CV/eva.pdf', 1, 'N/A'),
+        ('new.pdf', 'CV/new.pdf', 0, NULL);
+    INSERT INTO cv_analysis (cv_name, nombre_candidato, score_fit, habilidades_coincidentes) VALUES
+        ('ana.pdf', 'Ana', 8.5, '["Python", "SQL"]'),
+        ('ben.pdf', 'Ben', NULL, '[]'),
+        ('eva.pdf', 'N/A', 3.0, '["SQL"]');
+"""
+
+def _expected(conn, job_id=None):
+    """Stats computed from scratch over cv_analysis, in the column order of analysis_stats"""
+    where, params = ("WHERE job_id = ?", (job_id,)) if job_id is not None else ("", ())
+    total, score_sum, high, excellent, good, moderate, low, candidates = conn.execute(f"""
+        SELECT COUNT(*), COALESCE(SUM(score_fit), 0),
+               COALESCE(SUM(score_fit >= 7.0), 0), COALESCE(SUM(score_fit >= 8.0), 0),
+               COALESCE(SUM(score_fit >= 6.0 AND score_fit < 8.0), 0),
+               COALESCE(SUM(score_fit >= 4.0 AND score_fit < 6.0), 0), COALESCE(SUM(score_fit < 4.0), 0),
+               COUNT(DISTINCT CASE WHEN nombre_candidato NOT IN ('', 'N/A') THEN nombre_candidato END)
+        FROM cv_analysis {where}
+    """, params).fetchone()
+    return total, pytest.approx(score_sum), high, excellent, good, moderate, low, candidates
+
+STATS_COLUMNS = "total, score_sum, high_scores, excellent, good, moderate, low, unique_candidates"
+
+def assert_stats_match():
+    conn = sqlite3.connect(database.DB_PATH)
+    try:
+        assert conn.execute(f"SELECT {STATS_COLUMNS} FROM analysis_stats WHERE id = 1").fetchone() == _expected(conn)
+        job_ids = [row[0] for row in conn.execute("SELECT id FROM job_description UNION SELECT job_id FROM job_stats")]
+        for job_id in job_ids:
+            row = conn.execute(f"SELECT {STATS_COLUMNS} FROM job_stats WHERE job_id = ?", (job_id,)).fetchone()
+            assert (row or (0, 0.0, 0, 0, 0, 0, 0, 0)) == _expected(conn, job_id), f"job {job_id}"
+        # Stats rows of deleted jobs must not be left behind
+        assert set(job_ids) == {row[0] for row in conn.execute("SELECT id FROM job_description")}
+    finally:
+        conn.close()
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    """A baseline database migrated to the current schema; returns the id of its job"""
+    path = str(tmp_path / "cv_database.db")
+    conn = sqlite3.connect(path)
+    conn.executescript(BASELINE_SCHEMA)
+    conn.close()
+    monkeypatch.setattr(database, "DB_PATH", path)
+    database.create_table()
+    return database.get_jobs()[0][0]
+
+def test_migration_from_baseline(db):
+    conn = sqlite3.connect(database.DB_PATH)
+    assert conn.execute("PRAGMA user_version").fetchone()[0] == len(database.MIGRATIONS)
+    assert conn.execute("SELECT COUNT(*) FROM cv_analysis WHERE job_id = ?", (db,)).fetchone()[0] == 3
+    conn.close()
+    assert_stats_match()
+    summary = database.get_analysis_summary()
+    assert summary["total"] == 3
+    assert summary["unique_candidates"] == 2
+
+def test_save_and_resave(db):
+    database.save_analysis_result("new.pdf", db, {"nombre_candidato": "Nora", "score_fit": 6.5})
+    assert_stats_match()
+    # Re-saving replaces the row: counters move from the old score and name to the new ones
+    database.save_analysis_result("new.pdf", db, {"nombre_candidato": "Ana", "score_fit": 9})
+    assert_stats_match()
+    database.save_analysis_batch([("ana.pdf", db, {"nombre_candidato": "Ana", "score_fit": 4.5}, None),
+                                  ("ben.pdf", db, {"nombre_candidato": "Ben", "score_fit": "7"}, None)])
+    assert_stats_match()
+    assert database.get_analysis_summary(db)["unique_candidates"] == 2
+
+def test_link_duplicate_and_content_change(db):
+    database.register_cvs([("ana.pdf", "CV/ana.pdf", "hash-ana"), ("ben.pdf", "CV/ben.pdf", "hash-ben")])
+    assert_stats_match()
+    database.link_duplicate_cv("ana-copy.pdf", "ana.pdf")
+    assert_stats_match()
+    assert database.get_analysis_summary(db)["total"] == 4
+    # New content for a registered name drops the analyses of the old content
+    database.register_cvs([("ana.pdf", "CV/ana.pdf", "hash-ana-2")])
+    assert_stats_match()
+    assert database.get_analysis_result("ana.pdf", db) is None
+
+def test_delete_job_and_clear(db):
+    other = database.create_job("QA", "QA engineer")
+    database.save_analysis_batch([("ana.pdf", other, {"nombre_candidato": "Ana", "score_fit": 7.5}, None),
+                                  ("ben.pdf", other, {"nombre_candidato": "Ben", "score_fit": 2}, None)])
+    assert_stats_match()
+    database.delete_job(db)
+    assert_stats_match()
+    assert database.get_analysis_summary()["total"] == 2
+    database.clear_database()
+    assert_stats_match()
+    assert database.get_analysis_summary()["total"] == 0
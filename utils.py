@@ -1,5 +1,6 @@
 import streamlit as st
 from database import get_analysis_result
+from analyzer import load_analysis_json
 import json
 
 def navigate_to_page(page_name):
@@ -265,14 +266,7 @@ def handle_no_data_message(message, show_back=True):
 def parse_json_result(analysis_result):
     """Parse JSON result from analyzer with error handling"""
     try:
-        # Clean the result to extract JSON
-        result_text = analysis_result.strip()
-        if result_text.startswith("```json"):
-            result_text = result_text[7:]
-        if result_text.endswith("```"):
-            result_text = result_text[:-3]
-        
-        return json.loads(result_text)
+        return load_analysis_json(analysis_result)
     except json.JSONDecodeError as json_error:
         st.error(f"Error parsing JSON result: {json_error}")
         st.write("Raw result:", analysis_result)